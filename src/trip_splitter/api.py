@@ -0,0 +1,420 @@
+# src/trip_splitter/api.py
+from __future__ import annotations
+
+import hashlib
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException, Request, Response
+from pydantic import BaseModel, Field
+
+from .db import (
+    ConflictError,
+    InvalidTripNameError,
+    SettlementStore,
+    add_participant,
+    create_trip,
+    delete_expense,
+    delete_trip,
+    ensure_indexes,
+    fetch_expenses,
+    get_expense,
+    get_trip,
+    insert_expense,
+    insert_expenses,
+    list_trips,
+    make_expense,
+    new_client_id,
+    participants_in_use,
+    update_expense,
+    update_trip,
+)
+from .utils import compute_balances, settlement_cache
+
+
+# ---------- REQUEST BODIES ----------
+
+class TripIn(BaseModel):
+    trip_name: str = Field(min_length=1)
+    participants: List[str] = Field(min_length=1)
+    categories: Optional[List[str]] = None
+
+
+class TripPatch(BaseModel):
+    participants: Optional[List[str]] = None
+    categories: Optional[List[str]] = None
+    # Finished trips persist their settlements to Mongo
+    finished: Optional[bool] = None
+    # Compare-and-set: only apply if the trip is still at this data_version
+    data_version: Optional[int] = None
+
+
+class ParticipantIn(BaseModel):
+    name: str = Field(min_length=1)
+    # Compare-and-set, like TripPatch.data_version (or send If-Match)
+    data_version: Optional[int] = None
+
+
+class ExpenseIn(BaseModel):
+    paid_by: str
+    amount: float = Field(gt=0)
+    description: str = ""
+    category: str = Field(min_length=1)
+    included: Optional[List[str]] = None
+    timestamp: Optional[str] = None
+    client_id: Optional[str] = None
+
+
+class ExpensePatch(BaseModel):
+    paid_by: Optional[str] = None
+    amount: Optional[float] = Field(default=None, gt=0)
+    description: Optional[str] = None
+    category: Optional[str] = Field(default=None, min_length=1)
+    included: Optional[List[str]] = None
+    timestamp: Optional[str] = None
+    # Compare-and-set: only apply if the expense is still at this version
+    version: Optional[int] = None
+
+
+# ---------- HELPERS ----------
+
+def _serialize_expense(expense: Dict[str, Any]) -> Dict[str, Any]:
+    out = dict(expense)
+    if "_id" in out:
+        out["_id"] = str(out["_id"])
+    return out
+
+
+def _require_trip(db, trip_name: str) -> Dict[str, Any]:
+    trip = get_trip(db, trip_name)
+    if trip is None:
+        raise HTTPException(status_code=404, detail=f"Trip '{trip_name}' not found.")
+    return trip
+
+
+def _validate_people(trip: Dict[str, Any], paid_by: Optional[str], included: Optional[List[str]]) -> None:
+    participants = trip.get("participants", [])
+    if paid_by is not None and paid_by not in participants:
+        raise HTTPException(status_code=422, detail=f"'{paid_by}' is not a participant.")
+    if included is not None:
+        if not included:
+            raise HTTPException(
+                status_code=422,
+                detail="At least one participant must be included in the split.",
+            )
+        unknown = [p for p in included if p not in participants]
+        if unknown:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Not participants: {', '.join(unknown)}",
+            )
+
+
+def _etag(trip: Dict[str, Any]) -> str:
+    """
+    Weak ETag for a trip's current state.
+
+    `created_at` identifies the trip incarnation, so a trip that is deleted
+    and recreated under the same name never reuses old tags. The parts are
+    hashed because trip names are free text and headers must be Latin-1.
+    """
+    raw = f"{trip['trip_name']}\x00{trip.get('created_at', '')}\x00{trip.get('data_version', 0)}"
+    return f'W/"{hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]}"'
+
+
+def _if_match(request: Request, etag: str) -> Optional[bool]:
+    """
+    None if the request has no If-Match header, else whether it matches `etag`.
+    Our tags are weak but change on every write, so they are compared as-is.
+    """
+    header = request.headers.get("if-match")
+    if header is None:
+        return None
+    return header.strip() == "*" or etag in [t.strip() for t in header.split(",")]
+
+
+def _expected_trip_version(
+    request: Request, trip: Dict[str, Any], data_version: Optional[int]
+) -> int:
+    """
+    The data_version a trip-level write must be conditional on: the one in
+    the body, or the current one if If-Match carries the trip's ETag.
+    Unconditional writes would silently overwrite concurrent edits, so a
+    write with neither is refused with 428.
+    """
+    if data_version is not None:
+        return data_version
+    matched = _if_match(request, _etag(trip))
+    if matched is None:
+        raise HTTPException(
+            status_code=428, detail="Send the trip's data_version or an If-Match header."
+        )
+    if not matched:
+        raise HTTPException(status_code=412, detail="This trip was changed by someone else.")
+    return int(trip.get("data_version", 0) or 0)
+
+
+def _expected_expense_version(
+    request: Request, db, trip_name: str, expense_id: str, version: Optional[int]
+) -> int:
+    """
+    Like _expected_trip_version, for expense writes: the expense `version`
+    from the request, or its current version if If-Match carries the trip's
+    ETag. The expense is read before the tag is checked; every expense write
+    bumps the trip's data_version first, so a write landing in between
+    changes the tag and fails the check instead of being overwritten.
+    """
+    if version is not None:
+        return version
+    if request.headers.get("if-match") is None:
+        raise HTTPException(
+            status_code=428, detail="Send the expense's version or an If-Match header."
+        )
+    expense = get_expense(db, trip_name, expense_id)
+    if expense is None:
+        raise HTTPException(status_code=404, detail="Expense not found.")
+    if not _if_match(request, _etag(_require_trip(db, trip_name))):
+        raise HTTPException(status_code=412, detail="This trip was changed by someone else.")
+    return int(expense.get("version", 0) or 0)
+
+
+def _conditional(request: Request, response: Response, db, trip_name: str) -> Optional[Response]:
+    """
+    Set the ETag for a trip-scoped GET and return a 304 response if the
+    client's If-None-Match already matches the trip's data version.
+    """
+    trip = _require_trip(db, trip_name)
+    etag = _etag(trip)
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [t.strip() for t in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return None
+
+
+# ---------- APP ----------
+
+def create_app(db) -> FastAPI:
+    """
+    Build the JSON API around a pymongo-compatible database handle.
+
+    `db` is any object that behaves like a pymongo Database (a real
+    connection from `db.get_db`, or a local stand-in such as mongomock).
+    """
+    api = FastAPI(title="Trip Splitter API")
+    ensure_indexes(db)
+    settlement_store = SettlementStore(db)
+
+    # ---- Trips ----
+
+    @api.get("/trips")
+    def trips_list() -> List[Dict[str, Any]]:
+        return list_trips(db)
+
+    @api.post("/trips", status_code=201)
+    def trips_create(body: TripIn) -> Dict[str, Any]:
+        participants = [p.strip() for p in body.participants if p.strip()]
+        if not participants:
+            raise HTTPException(status_code=422, detail="Please enter at least one participant.")
+        categories = None
+        if body.categories is not None:
+            categories = [c.strip() for c in body.categories if c.strip()]
+        try:
+            return create_trip(db, body.trip_name.strip(), participants, categories)
+        except InvalidTripNameError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+
+    @api.get("/trips/{trip_name}")
+    def trips_get(trip_name: str, request: Request, response: Response):
+        not_modified = _conditional(request, response, db, trip_name)
+        if not_modified is not None:
+            return not_modified
+        return _require_trip(db, trip_name)
+
+    @api.patch("/trips/{trip_name}")
+    def trips_update(trip_name: str, body: TripPatch, request: Request) -> Dict[str, Any]:
+        trip = _require_trip(db, trip_name)
+        fields = body.model_dump(exclude_unset=True, exclude_none=True)
+        expected_version = _expected_trip_version(
+            request, trip, fields.pop("data_version", None)
+        )
+        if "participants" in fields:
+            stripped = (p.strip() for p in fields["participants"])
+            participants = list(dict.fromkeys(p for p in stripped if p))
+            if not participants:
+                raise HTTPException(status_code=422, detail="Please enter at least one participant.")
+            removed = participants_in_use(db, trip_name) - set(participants)
+            if removed:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Still used in expenses: {', '.join(sorted(removed))}",
+                )
+            fields["participants"] = participants
+        if not fields:
+            return _require_trip(db, trip_name)
+        try:
+            trip = update_trip(db, trip_name, fields, expected_version=expected_version)
+        except ConflictError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        if trip is None:
+            raise HTTPException(status_code=404, detail=f"Trip '{trip_name}' not found.")
+        return trip
+
+    @api.delete("/trips/{trip_name}", status_code=204)
+    def trips_delete(trip_name: str) -> Response:
+        if not delete_trip(db, trip_name):
+            raise HTTPException(status_code=404, detail=f"Trip '{trip_name}' not found.")
+        return Response(status_code=204)
+
+    @api.post("/trips/{trip_name}/participants")
+    def participants_add(trip_name: str, body: ParticipantIn, request: Request) -> Dict[str, Any]:
+        trip = _require_trip(db, trip_name)
+        name = body.name.strip()
+        if not name:
+            raise HTTPException(status_code=422, detail="Participant name cannot be empty.")
+        expected_version = _expected_trip_version(request, trip, body.data_version)
+        try:
+            add_participant(db, trip_name, name, expected_version=expected_version)
+        except ConflictError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        return _require_trip(db, trip_name)
+
+    # ---- Expenses ----
+
+    @api.get("/trips/{trip_name}/expenses")
+    def expenses_list(trip_name: str, request: Request, response: Response):
+        not_modified = _conditional(request, response, db, trip_name)
+        if not_modified is not None:
+            return not_modified
+        return [_serialize_expense(e) for e in fetch_expenses(db, trip_name)]
+
+    @api.post("/trips/{trip_name}/expenses", status_code=201)
+    def expenses_create(trip_name: str, body: ExpenseIn) -> Dict[str, Any]:
+        trip = _require_trip(db, trip_name)
+        participants = trip.get("participants", [])
+        included = body.included if body.included is not None else participants
+        _validate_people(trip, body.paid_by, included)
+        expense = make_expense(
+            body.paid_by,
+            body.amount,
+            body.description,
+            body.category.strip(),
+            included,
+            body.timestamp,
+        )
+        if body.client_id:
+            expense["client_id"] = body.client_id
+        return _serialize_expense(insert_expense(db, trip_name, expense))
+
+    @api.post("/trips/{trip_name}/expenses/batch", status_code=201)
+    def expenses_create_batch(trip_name: str, body: List[ExpenseIn]) -> Dict[str, Any]:
+        """Insert many expenses at once; `client_id` makes re-sending a batch safe."""
+        trip = _require_trip(db, trip_name)
+        participants = trip.get("participants", [])
+        batch = []
+        for item in body:
+            included = item.included if item.included is not None else participants
+            _validate_people(trip, item.paid_by, included)
+            expense = make_expense(
+                item.paid_by,
+                item.amount,
+                item.description,
+                item.category.strip(),
+                included,
+                item.timestamp,
+            )
+            expense["client_id"] = item.client_id or new_client_id()
+            batch.append(expense)
+        return {"inserted": insert_expenses(db, trip_name, batch)}
+
+    @api.get("/trips/{trip_name}/expenses/{expense_id}")
+    def expenses_get(trip_name: str, expense_id: str, request: Request, response: Response):
+        not_modified = _conditional(request, response, db, trip_name)
+        if not_modified is not None:
+            return not_modified
+        expense = get_expense(db, trip_name, expense_id)
+        if expense is None:
+            raise HTTPException(status_code=404, detail="Expense not found.")
+        return _serialize_expense(expense)
+
+    @api.patch("/trips/{trip_name}/expenses/{expense_id}")
+    def expenses_update(
+        trip_name: str, expense_id: str, body: ExpensePatch, request: Request
+    ) -> Dict[str, Any]:
+        trip = _require_trip(db, trip_name)
+        fields = body.model_dump(exclude_unset=True, exclude_none=True)
+        _validate_people(trip, fields.get("paid_by"), fields.get("included"))
+        expected_version = _expected_expense_version(
+            request, db, trip_name, expense_id, fields.pop("version", None)
+        )
+        if "amount" in fields:
+            fields["amount"] = float(fields["amount"])
+        try:
+            found = not fields or update_expense(
+                db, trip_name, expense_id, fields, expected_version=expected_version
+            )
+        except ConflictError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        if not found:
+            raise HTTPException(status_code=404, detail="Expense not found.")
+        expense = get_expense(db, trip_name, expense_id)
+        if expense is None:
+            raise HTTPException(status_code=404, detail="Expense not found.")
+        return _serialize_expense(expense)
+
+    @api.delete("/trips/{trip_name}/expenses/{expense_id}", status_code=204)
+    def expenses_delete(
+        trip_name: str, expense_id: str, request: Request, version: Optional[int] = None
+    ) -> Response:
+        _require_trip(db, trip_name)
+        expected_version = _expected_expense_version(request, db, trip_name, expense_id, version)
+        try:
+            found = delete_expense(db, trip_name, expense_id, expected_version=expected_version)
+        except ConflictError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        if not found:
+            raise HTTPException(status_code=404, detail="Expense not found.")
+        return Response(status_code=204)
+
+    # ---- Summaries ----
+
+    @api.get("/trips/{trip_name}/balances")
+    def balances_get(trip_name: str, request: Request, response: Response):
+        not_modified = _conditional(request, response, db, trip_name)
+        if not_modified is not None:
+            return not_modified
+        trip = _require_trip(db, trip_name)
+        total, balances, person_spent, person_owes, category_spent = compute_balances(
+            fetch_expenses(db, trip_name), trip.get("participants", [])
+        )
+        return {
+            "total": total,
+            "balances": balances,
+            "person_spent": person_spent,
+            "person_owes": person_owes,
+            "category_spent": category_spent,
+        }
+
+    @api.get("/trips/{trip_name}/settlements")
+    def settlements_get(trip_name: str, request: Request, response: Response):
+        not_modified = _conditional(request, response, db, trip_name)
+        if not_modified is not None:
+            return not_modified
+        trip = _require_trip(db, trip_name)
+        _, balances, _, _, _ = compute_balances(
+            fetch_expenses(db, trip_name), trip.get("participants", [])
+        )
+        persist = settlement_store if trip.get("finished") else None
+        return [
+            {"from": frm, "to": to, "amount": amt}
+            for frm, to, amt in settlement_cache.get(
+                balances, persist=persist, order=trip.get("participants")
+            )
+        ]
+
+    @api.get("/stats/settlement-cache")
+    def settlement_cache_stats() -> Dict[str, Any]:
+        return settlement_cache.stats()
+
+    return api
@@ -1,14 +1,23 @@
 from __future__ import annotations
 
-from datetime import datetime
-
 import matplotlib.pyplot as plt
 import pandas as pd
 import streamlit as st
-from pymongo import MongoClient
+from pymongo.errors import PyMongoError
 
 from config import get_config
-from utils import compute_balances, optimize_settlements
+from db import (
+    DEFAULT_CATEGORIES,
+    ConflictError,
+    MongoStore,
+    SettlementStore,
+    ensure_indexes,
+    get_db,
+    make_expense,
+    new_client_id,
+)
+from local import get_local_store, start_sync
+from utils import apply_deltas, compute_balances, expense_deltas, settlement_cache
 
 st.set_page_config(page_title="Trip Splitter", layout="wide")
 
@@ -27,14 +36,22 @@ except RuntimeError as e:
     st.error(str(e))
     st.stop()
 
-mongo_uri = cfg["mongo"]["uri"]
-db_name = cfg["mongo"]["db_name"]
-
-client = MongoClient(mongo_uri)
-db = client[db_name]
-
-# Trip config collection; you said yours is "Trip_names"
-TRIP_CONFIG_COLLECTION = db["Trip_names"]  # change if you prefer a different name
+# Local-first mode: read/write an embedded store, sync to MongoDB in the background.
+# Otherwise talk to MongoDB directly through the shared client (one pool for all reruns).
+if cfg["local"]["enabled"]:
+    store = get_local_store(cfg["local"]["path"])
+    sync_worker = start_sync(
+        store,
+        lambda: get_db(cfg, cfg["local"]["server_selection_timeout_ms"]),
+        cfg["local"]["sync_interval"],
+    )
+    settlement_store = None
+    duplicate_trips = []
+else:
+    store = MongoStore(get_db(cfg))
+    sync_worker = None
+    settlement_store = SettlementStore(store.db)
+    duplicate_trips = ensure_indexes(store.db)
 
 
 # ---------- SIDEBAR: TRIP MANAGEMENT ----------
@@ -42,8 +59,34 @@ TRIP_CONFIG_COLLECTION = db["Trip_names"]  # change if you prefer a different na
 with st.sidebar:
     st.title("🗺️ Trips")
 
+    if duplicate_trips:
+        st.warning(
+            "These trip names exist more than once in the database, so trip names "
+            f"can't be kept unique until the extra copies are removed: {', '.join(duplicate_trips)}"
+        )
+
+    if sync_worker is not None:
+        pending = len(store.pending())
+        if sync_worker.online:
+            st.caption(f"🟢 Online · last sync {sync_worker.last_sync} · {pending} pending")
+        else:
+            st.caption(f"🔴 Offline · working locally · {pending} pending")
+        if sync_worker.conflicts:
+            st.caption(
+                f"⚠️ Offline edits to {sync_worker.conflicts} expenses were skipped because "
+                "someone else changed those expenses first."
+            )
+        for old_name, new_name in list(sync_worker.renamed.items()):
+            st.caption(
+                f"ℹ️ A different trip called '{old_name}' already existed online, "
+                f"so your offline trip was saved as '{new_name}'."
+            )
+        if st.button("🔄 Sync now", key="sync_now_button"):
+            sync_worker.request_sync()
+            st.info("Sync started in the background. Refresh in a moment to see the result.")
+
     # Load existing trips
-    trip_docs = list(TRIP_CONFIG_COLLECTION.find({}, {"_id": 0}))
+    trip_docs = store.list_trips()
     trip_names = [t["trip_name"] for t in trip_docs]
 
     selected_trip = st.selectbox(
@@ -77,25 +120,20 @@ with st.sidebar:
             else:
                 participants = [p.strip() for p in participants_input.split(",") if p.strip()]
                 categories = [c.strip() for c in categories_input.split(",") if c.strip()]
-                TRIP_CONFIG_COLLECTION.insert_one(
-                    {
-                        "trip_name": new_trip_name,
-                        "participants": participants,
-                        "categories": categories,
-                        "created_at": datetime.now().isoformat(),
-                    }
-                )
-                st.success(f"Trip '{new_trip_name}' created. Select it from the dropdown above.")
-                st.rerun()
+                try:
+                    store.create_trip(new_trip_name, participants, categories)
+                except ValueError as e:
+                    st.warning(str(e))
+                else:
+                    st.success(f"Trip '{new_trip_name}' created. Select it from the dropdown above.")
+                    st.rerun()
 
     # ---- Manage participants for selected trip ----
     if selected_trip and selected_trip != "-- Select a trip --":
         st.markdown("---")
         with st.expander("👥 Manage participants"):
             # Fetch latest participants for this trip
-            trip_cfg = TRIP_CONFIG_COLLECTION.find_one(
-                {"trip_name": selected_trip}, {"_id": 0, "participants": 1}
-            )
+            trip_cfg = store.get_trip(selected_trip)
             current_participants = trip_cfg.get("participants", []) if trip_cfg else []
 
             if current_participants:
@@ -117,10 +155,7 @@ with st.sidebar:
                 elif np_clean in current_participants:
                     st.info(f"'{np_clean}' is already in the participant list.")
                 else:
-                    TRIP_CONFIG_COLLECTION.update_one(
-                        {"trip_name": selected_trip},
-                        {"$addToSet": {"participants": np_clean}},
-                    )
+                    store.add_participant(selected_trip, np_clean)
                     st.success(f"Added '{np_clean}' to participants.")
                     st.rerun()
 
@@ -134,28 +169,27 @@ if not selected_trip or selected_trip == "-- Select a trip --":
     st.stop()
 
 # Load selected trip config
-trip_config = TRIP_CONFIG_COLLECTION.find_one({"trip_name": selected_trip}, {"_id": 0})
+trip_config = store.get_trip(selected_trip)
 if not trip_config:
     st.error("Selected trip configuration not found. Please re-create the trip.")
     st.stop()
 
 participants = trip_config.get("participants", [])
-default_categories = trip_config.get(
-    "categories",
-    ["Food", "Fuel", "Stay", "Travel", "Activities", "Misc"],
-)
-
-trip_collection = db[selected_trip]
+default_categories = trip_config.get("categories", DEFAULT_CATEGORIES)
 
 
 # ---------- LOAD EXPENSES ----------
 
-def fetch_expenses():
-    # Keep _id so we can edit/delete
-    return list(trip_collection.find({"type": "expense"}))
+expenses = store.fetch_expenses(selected_trip)
 
+total, balances, person_spent, person_owes, category_spent = compute_balances(
+    expenses, participants
+)
 
-expenses = fetch_expenses()
+# Draft queue: expenses entered in draft mode live here until flushed in one batch.
+# deltas holds the running balance change so the preview never recomputes the trip.
+drafts_state = st.session_state.setdefault("drafts", {})
+trip_drafts = drafts_state.setdefault(selected_trip, {"expenses": [], "deltas": {}})
 
 
 # ---------- ADD EXPENSE UI ----------
@@ -195,27 +229,77 @@ else:
             default=[],
         )
 
+        draft_mode = st.checkbox(
+            "📝 Draft mode (queue expenses and save them in one batch)",
+            key="draft_mode",
+        )
+
         if st.button("✅ Add Expense", use_container_width=True):
             if paid_by and amount > 0 and category:
                 included_people = [p for p in participants if p not in excluded_people]
                 if not included_people:
                     st.warning("At least one person must be included in the split.")
                 else:
-                    expense = {
-                        "type": "expense",
-                        "paid_by": paid_by,
-                        "amount": float(amount),
-                        "description": description,
-                        "category": category,
-                        "included": included_people,
-                        "timestamp": datetime.now().strftime("%Y-%m-%d"),
-                    }
-                    trip_collection.insert_one(expense)
-                    st.success(f"🎉 Added ₹{amount:.2f} by {paid_by} under {category}")
-                    st.rerun()
+                    expense = make_expense(
+                        paid_by, amount, description, category, included_people
+                    )
+                    if draft_mode:
+                        expense["client_id"] = new_client_id()
+                        trip_drafts["expenses"].append(expense)
+                        for p, d in expense_deltas(expense, participants).items():
+                            trip_drafts["deltas"][p] = trip_drafts["deltas"].get(p, 0.0) + d
+                        st.success(f"📝 Queued ₹{amount:.2f} by {paid_by} under {category}")
+                    else:
+                        store.insert_expense(selected_trip, expense)
+                        st.success(f"🎉 Added ₹{amount:.2f} by {paid_by} under {category}")
+                        st.rerun()
             else:
                 st.warning("⚠️ Please enter all fields including category and a positive amount.")
 
+    # ---- Pending drafts ----
+    if trip_drafts["expenses"]:
+        queued = trip_drafts["expenses"]
+        with st.expander(f"📝 Pending drafts ({len(queued)})", expanded=True):
+            for e in queued:
+                st.write(
+                    f"💸 `{e['paid_by']}` paid ₹{e['amount']:.2f} for "
+                    f"*{e['description']}* [{e['category']}] "
+                    f"(Split among: {', '.join(e['included'])})"
+                )
+
+            st.caption("Balance preview including drafts (not saved yet):")
+            preview = apply_deltas(balances, trip_drafts["deltas"])
+            st.dataframe(
+                pd.DataFrame(
+                    [
+                        {
+                            "Participant": p,
+                            "Saved balance (₹)": round(balances.get(p, 0.0), 2),
+                            "With drafts (₹)": round(preview.get(p, 0.0), 2),
+                        }
+                        for p in participants
+                    ]
+                ),
+                use_container_width=True,
+            )
+
+            col_d1, col_d2 = st.columns(2)
+            with col_d1:
+                if st.button(f"💾 Save {len(queued)} drafts", use_container_width=True):
+                    try:
+                        store.insert_expenses(selected_trip, queued)
+                    except PyMongoError as e:
+                        # Keep the queue; retrying is safe thanks to client_id.
+                        st.error(f"Could not save drafts, please try again: {e}")
+                    else:
+                        drafts_state[selected_trip] = {"expenses": [], "deltas": {}}
+                        st.success(f"Saved {len(queued)} expenses.")
+                        st.rerun()
+            with col_d2:
+                if st.button("🗑️ Discard drafts", use_container_width=True):
+                    drafts_state[selected_trip] = {"expenses": [], "deltas": {}}
+                    st.rerun()
+
 
 # ---------- SUMMARY DATA ----------
 
@@ -223,10 +307,6 @@ if not expenses:
     st.info("No expenses yet. Add your first expense above.")
     st.stop()
 
-total, balances, person_spent, person_owes, category_spent = compute_balances(
-    expenses, participants
-)
-
 # Build a reusable DataFrame of expenses (for logs, edit/delete, export)
 df_exp = pd.DataFrame(expenses)
 if not df_exp.empty:
@@ -244,6 +324,7 @@ with m2:
     st.metric("Participants", len(participants))
 with m3:
     st.metric("Total Spent", f"₹{total:.2f}")
+st.caption(f"Data version {store.get_data_version(selected_trip) or 0}")
 
 
 # ---------- PER-PERSON SUMMARY ----------
@@ -324,12 +405,22 @@ with st.expander("📋 Net balances by person"):
 # ---------- WHO OWES WHOM (SETTLEMENTS) ----------
 
 with st.expander("🔁 Optimized settlements (who owes whom)"):
-    transactions = optimize_settlements(balances)
+    # Shared across sessions; finished trips also persist results to Mongo
+    transactions = settlement_cache.get(
+        balances,
+        persist=settlement_store if trip_config.get("finished") else None,
+        order=participants,
+    )
     if transactions:
         for frm, to, amt in transactions:
             st.write(f"👉 `{frm}` owes `{to}` ₹{amt:.2f}")
     else:
         st.success("Everyone is settled. No dues pending!")
+    cache_stats = settlement_cache.stats()
+    st.caption(
+        f"Settlement cache: {cache_stats['hit_rate']:.0%} hit rate "
+        f"({cache_stats['size']} cached)"
+    )
 
 
 # ---------- EDIT / DELETE EXPENSES ----------
@@ -356,6 +447,16 @@ with st.expander("✏️ Edit or delete expenses"):
         selected_row = df_exp[df_exp["__label__"] == selected_label].iloc[0]
         selected_id = selected_row["_id"]
 
+        # The form is rebuilt from the row on every rerun, so the user is
+        # editing the version shown on the *previous* run. A Save/Delete click
+        # is checked against that; if the row changed in between, it's a conflict.
+        selected_expense = next(e for e in expenses if e["_id"] == selected_id)
+        current_version = int(selected_expense.get("version", 0) or 0)
+        edit_versions = st.session_state.setdefault("edit_versions", {})
+        edit_key = f"{selected_trip}:{selected_id}"
+        expected_version = edit_versions.get(edit_key, current_version)
+        edit_versions[edit_key] = current_version
+
         col_e1, col_e2 = st.columns(2)
         with col_e1:
             edit_paid_by = st.selectbox(
@@ -393,25 +494,41 @@ with st.expander("✏️ Edit or delete expenses"):
                 if not edit_included:
                     st.warning("At least one participant must be included in the split.")
                 else:
-                    trip_collection.update_one(
-                        {"_id": selected_id},
-                        {
-                            "$set": {
+                    try:
+                        found = store.update_expense(
+                            selected_trip,
+                            selected_id,
+                            {
                                 "paid_by": edit_paid_by,
                                 "amount": float(edit_amount),
                                 "description": edit_description,
                                 "category": edit_category,
                                 "included": edit_included,
-                            }
-                        },
-                    )
-                    st.success("Expense updated.")
-                    st.rerun()
+                            },
+                            expected_version=expected_version,
+                        )
+                    except ConflictError as e:
+                        st.error(f"⚠️ {e}")
+                    else:
+                        if found:
+                            st.success("Expense updated.")
+                            st.rerun()
+                        else:
+                            st.warning("This expense was deleted by someone else.")
         with col_b2:
             if st.button("🗑️ Delete this expense"):
-                trip_collection.delete_one({"_id": selected_id})
-                st.success("Expense deleted.")
-                st.rerun()
+                try:
+                    found = store.delete_expense(
+                        selected_trip, selected_id, expected_version=expected_version
+                    )
+                except ConflictError as e:
+                    st.error(f"⚠️ {e}")
+                else:
+                    if found:
+                        st.success("Expense deleted.")
+                        st.rerun()
+                    else:
+                        st.warning("This expense was already deleted by someone else.")
 
 
 # ---------- EXPORT DATA ----------
@@ -420,7 +537,9 @@ with st.expander("⬇ Export data"):
     if df_exp.empty:
         st.write("No expenses to export.")
     else:
-        export_df = df_exp.drop(columns=["_id", "__label__"], errors="ignore")
+        export_df = df_exp.drop(
+            columns=["_id", "__label__", "version", "client_id", "last_op"], errors="ignore"
+        )
         csv_exp = export_df.to_csv(index=False).encode("utf-8")
         st.download_button(
             "Download expenses as CSV",
@@ -36,3 +36,127 @@ def run() -> None:
             "Error: streamlit not found. Install it with `pip install streamlit`.",
             fg=typer.colors.RED,
         )
+
+
+@app.command()
+def serve(
+    host: str = typer.Option("127.0.0.1", help="Interface to bind."),
+    port: int = typer.Option(8000, help="Port to listen on."),
+    secrets: Path = typer.Option(
+        Path(".streamlit/secrets.toml"),
+        help="secrets.toml with the [mongo] section (same format as the Streamlit app).",
+    ),
+) -> None:
+    """
+    Run the headless JSON API (trips, expenses, balances, settlements).
+
+    Requires the optional API dependencies: `pip install trip-splitter[api]`.
+    """
+    try:
+        import uvicorn
+
+        from .api import create_app
+    except ImportError as e:
+        typer.secho(
+            f"Error: {e}. Install the API extras with `pip install trip-splitter[api]`.",
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(code=1)
+
+    from .config import get_config, load_secrets_file
+    from .db import ensure_indexes, get_db
+
+    try:
+        cfg = get_config(load_secrets_file(secrets))
+    except RuntimeError as e:
+        typer.secho(str(e), fg=typer.colors.RED)
+        raise typer.Exit(code=1)
+
+    db = get_db(cfg)
+    duplicates = ensure_indexes(db)
+    if duplicates:
+        typer.secho(
+            "Warning: duplicate trip names block the unique trip_name index: "
+            + ", ".join(duplicates),
+            fg=typer.colors.YELLOW,
+        )
+    uvicorn.run(create_app(db), host=host, port=port)
+
+
+@app.command()
+def loadtest(
+    users: int = typer.Option(10, help="Number of concurrent simulated users."),
+    iterations: int = typer.Option(20, help="Page views per user."),
+    expenses: int = typer.Option(200, help="Expenses seeded into the test trip."),
+    participants: int = typer.Option(7, help="Participants in the test trip."),
+    write_ratio: float = typer.Option(0.1, help="Chance that a page view also adds an expense."),
+    uri: str = typer.Option(
+        "",
+        help="MongoDB URI (e.g. a local mongod). Leave empty to use the in-memory stand-in.",
+    ),
+    db_name: str = typer.Option("TripsLoadtest", help="Database used for the test trip."),
+    max_pool_size: int = typer.Option(100, help="MongoClient connection pool limit."),
+    trip_name: str = typer.Option("loadtest", help="Name of the seeded test trip."),
+    report: Path = typer.Option(Path("loadtest_report.json"), help="Where to write the JSON report."),
+    seed: int = typer.Option(0, help="Random seed."),
+    force: bool = typer.Option(
+        False, "--force", help="Replace the test trip if it already exists in the database."
+    ),
+) -> None:
+    """
+    Simulate concurrent users on one shared trip and report latency
+    percentiles and throughput for each data-layer operation.
+
+    Without --uri the test runs against mongomock (`pip install mongomock`).
+    The test trip is deleted afterwards; an existing trip with the same name
+    is never touched unless --force is given.
+    """
+    import json
+
+    from .db import delete_trip, ensure_indexes, get_client
+    from .loadtest import OPERATIONS, run_loadtest, seed_trip
+
+    if uri:
+        db = get_client(uri, max_pool_size)[db_name]
+        backend = "mongodb"
+    else:
+        try:
+            import mongomock
+        except ImportError:
+            typer.secho(
+                "Error: mongomock not found. Install it with `pip install mongomock` "
+                "or pass --uri for a local mongod.",
+                fg=typer.colors.RED,
+            )
+            raise typer.Exit(code=1)
+        db = mongomock.MongoClient()[db_name]
+        backend = "memory"
+
+    ensure_indexes(db)
+    people = [f"P{i + 1}" for i in range(participants)]
+    try:
+        seed_trip(db, trip_name, people, expenses, seed=seed, force=force)
+    except ValueError as e:
+        typer.secho(f"Error: {e}", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
+    try:
+        result = run_loadtest(
+            db, trip_name, users=users, iterations=iterations, write_ratio=write_ratio, seed=seed
+        )
+    finally:
+        delete_trip(db, trip_name)
+
+    result.update(
+        {"backend": backend, "seed_expenses": expenses, "max_pool_size": max_pool_size}
+    )
+    report.write_text(json.dumps(result, indent=2))
+
+    typer.echo(f"{'operation':<18}{'count':>7}{'err':>5}{'p50':>10}{'p95':>10}{'p99':>10}{'ops/s':>10}")
+    for op in OPERATIONS:
+        s = result["operations"][op]
+        typer.echo(
+            f"{op:<18}{s['count']:>7}{s['errors']:>5}"
+            f"{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}"
+            f"{s['throughput_ops_s']:>10.1f}"
+        )
+    typer.echo(f"Report written to {report}")
@@ -0,0 +1,583 @@
+# src/trip_splitter/db.py
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import (
+    BulkWriteError,
+    ConnectionFailure,
+    DuplicateKeyError,
+    OperationFailure,
+)
+
+# Trip config collection; one document per trip
+TRIP_CONFIG_COLLECTION = "Trip_names"
+
+# Persisted settlement results for finished trips (see utils.SettlementCache)
+SETTLEMENT_CACHE_COLLECTION = "Settlement_cache"
+
+DEFAULT_CATEGORIES = ["Food", "Fuel", "Stay", "Travel", "Activities", "Misc"]
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class ConflictError(RuntimeError):
+    """A conditional write lost the race: the document changed since it was read."""
+
+
+class InvalidTripNameError(ValueError):
+    """The trip name can't be used: each trip's expenses live in a collection of that name."""
+
+
+_clients: Dict[Any, MongoClient] = {}
+_clients_lock = threading.Lock()
+
+# Expense collections whose client_id index already exists, per client.
+# The client is kept alongside so its id() can't be reused.
+_indexed: Dict[int, Any] = {}
+_indexed_lock = threading.Lock()
+
+
+def get_client(
+    uri: str,
+    max_pool_size: int = 100,
+    server_selection_timeout_ms: Optional[int] = None,
+) -> MongoClient:
+    """
+    Return a process-wide MongoClient for `uri`.
+
+    MongoClient keeps its own connection pool, so every caller (Streamlit
+    reruns, API requests, load-test workers) should share one instance
+    instead of opening a fresh client per call. A short
+    `server_selection_timeout_ms` makes operations fail fast while Mongo is
+    unreachable (the driver default is 30 s).
+    """
+    key = (uri, max_pool_size, server_selection_timeout_ms)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            options: Dict[str, Any] = {"maxPoolSize": max_pool_size}
+            if server_selection_timeout_ms is not None:
+                options["serverSelectionTimeoutMS"] = server_selection_timeout_ms
+            client = MongoClient(uri, **options)
+            _clients[key] = client
+        return client
+
+
+def get_db(cfg: Dict[str, Any], server_selection_timeout_ms: Optional[int] = None):
+    """Return the configured database from a `get_config()` result."""
+    mongo = cfg["mongo"]
+    client = get_client(
+        mongo["uri"], mongo.get("max_pool_size", 100), server_selection_timeout_ms
+    )
+    return client[mongo["db_name"]]
+
+
+def version_filter(expected_version: int) -> Dict[str, Any]:
+    # Documents written before versioning have no field; treat them as version 0.
+    if expected_version:
+        return {"version": expected_version}
+    return {"version": {"$in": [0, None]}}
+
+
+def parse_expense_id(expense_id: Any) -> Optional[ObjectId]:
+    """Return `expense_id` as an ObjectId, or None if it is not a valid id."""
+    if isinstance(expense_id, ObjectId):
+        return expense_id
+    try:
+        return ObjectId(str(expense_id))
+    except (InvalidId, TypeError):
+        return None
+
+
+def ensure_expense_indexes(db, trip_name: str) -> None:
+    """
+    Create the unique client_id index on a trip's expense collection, once
+    per process. Idempotency keys (drafts, sync, API batches) rely on it.
+    """
+    key = (db.name, trip_name)
+    with _indexed_lock:
+        _, done = _indexed.setdefault(id(db.client), (db.client, set()))
+        if key in done:
+            return
+    db[trip_name].create_index("client_id", unique=True, sparse=True)
+    with _indexed_lock:
+        done.add(key)
+
+
+def ensure_indexes(db) -> List[str]:
+    """
+    Create the shared indexes once per process; call at startup.
+
+    Returns the trip names that are already duplicated in the trip config
+    collection. Those block the unique trip_name index, so the caller
+    should report them. The next call retries until they are cleaned up.
+    """
+    key = (db.name, None)
+    with _indexed_lock:
+        _, done = _indexed.setdefault(id(db.client), (db.client, set()))
+        if key in done:
+            return []
+    _ensure_settlement_cache_index(db[SETTLEMENT_CACHE_COLLECTION])
+    try:
+        db[TRIP_CONFIG_COLLECTION].create_index("trip_name", unique=True)
+    except OperationFailure as e:
+        if e.code != DUPLICATE_KEY_ERROR:
+            raise
+        return [
+            d["_id"]
+            for d in db[TRIP_CONFIG_COLLECTION].aggregate(
+                [
+                    {"$group": {"_id": "$trip_name", "n": {"$sum": 1}}},
+                    {"$match": {"n": {"$gt": 1}}},
+                ]
+            )
+        ]
+    with _indexed_lock:
+        done.add(key)
+    return []
+
+
+def _ensure_settlement_cache_index(collection) -> None:
+    # Cached settlements are derived data, so copies left by earlier
+    # concurrent upserts are identical and can simply be dropped.
+    try:
+        collection.create_index("key", unique=True)
+    except OperationFailure as e:
+        if e.code != DUPLICATE_KEY_ERROR:
+            raise
+        for dup in collection.aggregate(
+            [
+                {"$group": {"_id": "$key", "ids": {"$push": "$_id"}, "n": {"$sum": 1}}},
+                {"$match": {"n": {"$gt": 1}}},
+            ]
+        ):
+            collection.delete_many({"_id": {"$in": dup["ids"][1:]}})
+        collection.create_index("key", unique=True)
+
+
+def _is_transient(error: Exception) -> bool:
+    """True for errors worth retrying: lost connections and retryable writes."""
+    if isinstance(error, ConnectionFailure):
+        return True
+    return isinstance(error, OperationFailure) and error.has_error_label("RetryableWriteError")
+
+
+# ---------- TRIPS ----------
+
+def validate_trip_name(trip_name: str) -> None:
+    """
+    Raise InvalidTripNameError unless `trip_name` is safe to use as the trip's
+    expense collection: not blank, not one of the app's own collections, and
+    a collection name MongoDB accepts.
+    """
+    if not trip_name or not trip_name.strip():
+        raise InvalidTripNameError("Trip name cannot be empty.")
+    if trip_name in (TRIP_CONFIG_COLLECTION, SETTLEMENT_CACHE_COLLECTION):
+        raise InvalidTripNameError(f"'{trip_name}' is reserved. Choose a different name.")
+    if trip_name.startswith("system.") or "$" in trip_name or "\0" in trip_name:
+        raise InvalidTripNameError(
+            "Trip names can't contain '$' or a NUL character, or start with 'system.'."
+        )
+
+
+def list_trips(db) -> List[Dict[str, Any]]:
+    return list(db[TRIP_CONFIG_COLLECTION].find({}, {"_id": 0}))
+
+
+def get_trip(db, trip_name: str) -> Optional[Dict[str, Any]]:
+    return db[TRIP_CONFIG_COLLECTION].find_one({"trip_name": trip_name}, {"_id": 0})
+
+
+def create_trip(
+    db,
+    trip_name: str,
+    participants: Iterable[str],
+    categories: Optional[Iterable[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Insert a new trip config document.
+
+    Raises InvalidTripNameError (a ValueError) for names that can't be a
+    collection (see validate_trip_name), and ValueError if a trip with the
+    same name already exists. Once ensure_indexes() has run, uniqueness is
+    enforced by an index, so two people creating the same trip at once
+    cannot both succeed.
+    """
+    validate_trip_name(trip_name)
+    if get_trip(db, trip_name) is not None:
+        raise ValueError("A trip with this name already exists. Choose a different name.")
+
+    trip = {
+        "trip_name": trip_name,
+        "participants": list(participants),
+        "categories": list(categories) if categories is not None else list(DEFAULT_CATEGORIES),
+        "created_at": datetime.now().isoformat(),
+        "data_version": 0,
+    }
+    try:
+        db[TRIP_CONFIG_COLLECTION].insert_one(trip)
+    except DuplicateKeyError:
+        raise ValueError("A trip with this name already exists. Choose a different name.")
+    trip.pop("_id", None)
+    ensure_expense_indexes(db, trip_name)
+    return trip
+
+
+def update_trip(
+    db,
+    trip_name: str,
+    fields: Dict[str, Any],
+    expected_version: Optional[int] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Set `fields` on the trip config and bump its data version.
+
+    With `expected_version` the update only applies if the trip's
+    data_version still matches; otherwise ConflictError is raised.
+    Returns None if the trip does not exist.
+    """
+    query: Dict[str, Any] = {"trip_name": trip_name}
+    if expected_version is not None:
+        query["data_version"] = (
+            expected_version if expected_version else {"$in": [0, None]}
+        )
+    # Read the document as matched and apply the update to it, rather than
+    # re-reading after the write (mongomock re-runs the version filter on
+    # the updated document and returns None).
+    trip = db[TRIP_CONFIG_COLLECTION].find_one_and_update(
+        query,
+        {"$set": fields, "$inc": {"data_version": 1}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if trip is None:
+        if expected_version is not None and get_trip(db, trip_name) is not None:
+            raise ConflictError("This trip was changed by someone else. Reload and try again.")
+        return None
+    trip.update(fields)
+    trip["data_version"] = int(trip.get("data_version", 0) or 0) + 1
+    return trip
+
+
+def add_participant(
+    db,
+    trip_name: str,
+    participant: str,
+    expected_version: Optional[int] = None,
+) -> None:
+    """
+    Add `participant` to the trip. With `expected_version` this only applies
+    if the trip's data_version still matches; otherwise ConflictError is raised.
+    """
+    query: Dict[str, Any] = {"trip_name": trip_name}
+    if expected_version is not None:
+        query["data_version"] = (
+            expected_version if expected_version else {"$in": [0, None]}
+        )
+    result = db[TRIP_CONFIG_COLLECTION].update_one(
+        query,
+        {"$addToSet": {"participants": participant}, "$inc": {"data_version": 1}},
+    )
+    if not result.matched_count and expected_version is not None and get_trip(db, trip_name):
+        raise ConflictError("This trip was changed by someone else. Reload and try again.")
+
+
+def participants_in_use(db, trip_name: str) -> set:
+    """Everyone named as payer or split member in the trip's expenses."""
+    collection = db[trip_name]
+    return set(collection.distinct("paid_by")) | set(collection.distinct("included"))
+
+
+def delete_trip(db, trip_name: str) -> bool:
+    """Delete the trip config and drop its expense collection (and its indexes)."""
+    result = db[TRIP_CONFIG_COLLECTION].delete_one({"trip_name": trip_name})
+    if result.deleted_count:
+        db[trip_name].drop()
+        with _indexed_lock:
+            _, done = _indexed.get(id(db.client), (None, set()))
+            done.discard((db.name, trip_name))
+    return bool(result.deleted_count)
+
+
+def get_data_version(db, trip_name: str) -> Optional[int]:
+    """
+    Return the trip's data version, or None if the trip does not exist.
+
+    Every write to the trip config or its expenses bumps this counter, so it
+    can be used as a cheap staleness check (e.g. HTTP ETags, caches).
+
+    The counter lives on the trip document and expenses live in their own
+    collection. Without a transaction, the bump is not atomic with the
+    expense write. Expense writes therefore bump before *and* after the
+    write, each bump retried on connection errors:
+      - a reader that caches data from before the write holds a version the
+        second bump invalidates;
+      - only a crash between the write and the second bump, while a reader
+        caches in that window, leaves a stale entry until the next write.
+    """
+    doc = db[TRIP_CONFIG_COLLECTION].find_one(
+        {"trip_name": trip_name}, {"_id": 0, "data_version": 1}
+    )
+    if doc is None:
+        return None
+    return int(doc.get("data_version", 0))
+
+
+def bump_data_version(db, trip_name: str, retries: int = 2, backoff: float = 0.1) -> None:
+    for attempt in range(retries + 1):
+        try:
+            db[TRIP_CONFIG_COLLECTION].update_one(
+                {"trip_name": trip_name}, {"$inc": {"data_version": 1}}
+            )
+            return
+        except ConnectionFailure:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * (2 ** attempt))
+
+
+# ---------- EXPENSES ----------
+
+def make_expense(
+    paid_by: str,
+    amount: float,
+    description: str,
+    category: str,
+    included: Iterable[str],
+    timestamp: Optional[str] = None,
+) -> Dict[str, Any]:
+    return {
+        "type": "expense",
+        "paid_by": paid_by,
+        "amount": float(amount),
+        "description": description,
+        "category": category,
+        "included": list(included),
+        "timestamp": timestamp or datetime.now().strftime("%Y-%m-%d"),
+        "version": 1,
+    }
+
+
+def new_client_id() -> str:
+    """Idempotency key for an expense created on the client (draft queue)."""
+    return uuid.uuid4().hex
+
+
+def fetch_expenses(db, trip_name: str) -> List[Dict[str, Any]]:
+    # Keep _id so we can edit/delete
+    return list(db[trip_name].find({"type": "expense"}))
+
+
+def get_expense(db, trip_name: str, expense_id: Any) -> Optional[Dict[str, Any]]:
+    oid = parse_expense_id(expense_id)
+    if oid is None:
+        return None
+    return db[trip_name].find_one({"_id": oid, "type": "expense"})
+
+
+def insert_expense(db, trip_name: str, expense: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Insert an expense document and return it with its new `_id`.
+
+    If the expense carries a `client_id` that was already stored, the
+    existing document is returned instead of inserting a duplicate.
+    """
+    expense = dict(expense)
+    expense.setdefault("version", 1)
+    if "client_id" in expense:
+        ensure_expense_indexes(db, trip_name)
+    bump_data_version(db, trip_name)
+    try:
+        result = db[trip_name].insert_one(expense)
+    except DuplicateKeyError:
+        if "client_id" not in expense:
+            raise
+        return db[trip_name].find_one({"client_id": expense["client_id"]})
+    expense["_id"] = result.inserted_id
+    bump_data_version(db, trip_name)
+    return expense
+
+
+def insert_expenses(
+    db,
+    trip_name: str,
+    expenses: List[Dict[str, Any]],
+    retries: int = 3,
+    backoff: float = 0.5,
+) -> int:
+    """
+    Write a batch of expenses in one bulk_write and return how many were new.
+
+    Every expense must carry a `client_id` idempotency key. Each one is written
+    as an upsert with $setOnInsert, so retrying a batch that partly succeeded
+    (or flushing the same draft twice) never creates duplicates. Connection
+    errors and retryable write errors are retried with exponential backoff;
+    anything else (auth, validation, ...) is raised immediately.
+    """
+    if not expenses:
+        return 0
+
+    collection = db[trip_name]
+    ensure_expense_indexes(db, trip_name)
+    bump_data_version(db, trip_name)
+    ops = [
+        UpdateOne(
+            {"client_id": e["client_id"]},
+            {"$setOnInsert": {k: v for k, v in e.items() if k != "client_id"}},
+            upsert=True,
+        )
+        for e in expenses
+    ]
+
+    for attempt in range(retries + 1):
+        try:
+            result = collection.bulk_write(ops, ordered=False)
+            inserted = result.upserted_count
+            break
+        except BulkWriteError as e:
+            # Two concurrent upserts on the same key: one wins, the other hits
+            # the unique index. The expense is stored either way.
+            write_errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != DUPLICATE_KEY_ERROR for err in write_errors):
+                raise
+            inserted = e.details.get("nUpserted", 0)
+            break
+        except (ConnectionFailure, OperationFailure) as e:
+            if attempt == retries or not _is_transient(e):
+                raise
+            time.sleep(backoff * (2 ** attempt))
+
+    bump_data_version(db, trip_name)
+    return inserted
+
+
+def update_expense(
+    db,
+    trip_name: str,
+    expense_id: Any,
+    fields: Dict[str, Any],
+    expected_version: Optional[int] = None,
+) -> bool:
+    """
+    Set `fields` on an expense and bump its version. Returns False if the
+    expense does not exist.
+
+    With `expected_version` this is a compare-and-set: if someone else saved
+    the expense since it was read, nothing is written and ConflictError is
+    raised.
+    """
+    oid = parse_expense_id(expense_id)
+    if oid is None:
+        return False
+    query: Dict[str, Any] = {"_id": oid, "type": "expense"}
+    if expected_version is not None:
+        query.update(version_filter(expected_version))
+    fields = {k: v for k, v in fields.items() if k not in ("_id", "version")}
+    bump_data_version(db, trip_name)
+    result = db[trip_name].update_one(query, {"$set": fields, "$inc": {"version": 1}})
+    if not result.matched_count:
+        if expected_version is not None and get_expense(db, trip_name, oid) is not None:
+            raise ConflictError("This expense was changed by someone else. Reload and try again.")
+        return False
+    bump_data_version(db, trip_name)
+    return True
+
+
+def delete_expense(
+    db,
+    trip_name: str,
+    expense_id: Any,
+    expected_version: Optional[int] = None,
+) -> bool:
+    """
+    Delete an expense. Returns False if it does not exist. With
+    `expected_version`, raises ConflictError if it was edited since it was read.
+    """
+    oid = parse_expense_id(expense_id)
+    if oid is None:
+        return False
+    query: Dict[str, Any] = {"_id": oid, "type": "expense"}
+    if expected_version is not None:
+        query.update(version_filter(expected_version))
+    bump_data_version(db, trip_name)
+    result = db[trip_name].delete_one(query)
+    if not result.deleted_count:
+        if expected_version is not None and get_expense(db, trip_name, oid) is not None:
+            raise ConflictError("This expense was changed by someone else. Reload and try again.")
+        return False
+    bump_data_version(db, trip_name)
+    return True
+
+
+class SettlementStore:
+    """
+    Persistent backing for utils.SettlementCache in the Settlement_cache
+    collection (unique index on `key`, see ensure_indexes).
+    """
+
+    def __init__(self, db):
+        self.collection = db[SETTLEMENT_CACHE_COLLECTION]
+
+    def load(self, key: str) -> Optional[List[List[Any]]]:
+        doc = self.collection.find_one({"key": key}, {"_id": 0, "transactions": 1})
+        return doc["transactions"] if doc is not None else None
+
+    def save(self, key: str, transactions: Iterable[Iterable[Any]]) -> None:
+        try:
+            self.collection.update_one(
+                {"key": key},
+                {"$set": {"transactions": [list(t) for t in transactions]}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # Another process upserted the same key first; settlements are
+            # deterministic, so its copy is the same as ours.
+            pass
+
+
+class MongoStore:
+    """
+    Thin wrapper binding the functions above to one database, with the same
+    method names as local.LocalStore so the app can talk to either.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def list_trips(self) -> List[Dict[str, Any]]:
+        return list_trips(self.db)
+
+    def get_trip(self, trip_name: str) -> Optional[Dict[str, Any]]:
+        return get_trip(self.db, trip_name)
+
+    def get_data_version(self, trip_name: str) -> Optional[int]:
+        return get_data_version(self.db, trip_name)
+
+    def create_trip(self, trip_name, participants, categories=None) -> Dict[str, Any]:
+        return create_trip(self.db, trip_name, participants, categories)
+
+    def add_participant(self, trip_name: str, participant: str) -> None:
+        add_participant(self.db, trip_name, participant)
+
+    def fetch_expenses(self, trip_name: str) -> List[Dict[str, Any]]:
+        return fetch_expenses(self.db, trip_name)
+
+    def insert_expense(self, trip_name: str, expense: Dict[str, Any]) -> Dict[str, Any]:
+        return insert_expense(self.db, trip_name, expense)
+
+    def insert_expenses(self, trip_name: str, expenses: List[Dict[str, Any]]) -> int:
+        return insert_expenses(self.db, trip_name, expenses)
+
+    def update_expense(self, trip_name, expense_id, fields, expected_version=None) -> bool:
+        return update_expense(self.db, trip_name, expense_id, fields, expected_version)
+
+    def delete_expense(self, trip_name, expense_id, expected_version=None) -> bool:
+        return delete_expense(self.db, trip_name, expense_id, expected_version)
@@ -0,0 +1,154 @@
+# src/trip_splitter/loadtest.py
+from __future__ import annotations
+
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+from .db import (
+    create_trip,
+    delete_trip,
+    fetch_expenses,
+    get_trip,
+    insert_expense,
+    list_trips,
+    make_expense,
+)
+from .utils import compute_balances
+
+OPERATIONS = ["list_trips", "get_trip", "fetch_expenses", "compute_balances", "insert_expense"]
+
+CATEGORIES = ["Food", "Fuel", "Stay", "Travel", "Activities", "Misc"]
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of `samples` (0 for an empty list)."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _random_expense(rng: random.Random, participants: List[str]) -> Dict[str, Any]:
+    included = rng.sample(participants, rng.randint(1, len(participants)))
+    return make_expense(
+        paid_by=rng.choice(participants),
+        amount=round(rng.uniform(50, 5000), 2),
+        description="loadtest",
+        category=rng.choice(CATEGORIES),
+        included=included,
+    )
+
+
+def seed_trip(
+    db,
+    trip_name: str,
+    participants: List[str],
+    expenses: int,
+    seed: int = 0,
+    force: bool = False,
+) -> None:
+    """
+    Create `trip_name` with `expenses` random expenses.
+
+    Raises ValueError if the trip already exists, so pointing the load test
+    at a real database can't wipe a real trip; `force=True` replaces it.
+    """
+    if get_trip(db, trip_name) is not None:
+        if not force:
+            raise ValueError(
+                f"Trip '{trip_name}' already exists in this database. "
+                "Pick another trip name or database, or replace it with --force."
+            )
+        delete_trip(db, trip_name)
+    create_trip(db, trip_name, participants, CATEGORIES)
+    rng = random.Random(seed)
+    docs = [_random_expense(rng, participants) for _ in range(expenses)]
+    if docs:
+        db[trip_name].insert_many(docs)
+
+
+def run_loadtest(
+    db,
+    trip_name: str,
+    users: int = 10,
+    iterations: int = 20,
+    write_ratio: float = 0.1,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Simulate `users` concurrent people opening the same trip.
+
+    Each simulated user does `iterations` page views. A page view mirrors one
+    Streamlit rerun: list trips, look up the trip config, fetch expenses and
+    compute balances. With probability `write_ratio` the view also adds an
+    expense. Returns a report with, per operation, latency percentiles (ms),
+    `busy_s` (summed time spent in that operation across all users) and
+    `throughput_ops_s`: completed operations per second of the whole run.
+    Every page view runs each read once, so the reads share one throughput;
+    compare `busy_s` to see which operation holds connections longest.
+    """
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    lock = threading.Lock()
+
+    def timed(op: str, fn: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        try:
+            return fn()
+        except Exception:
+            with lock:
+                errors[op] += 1
+            return None
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000.0
+            with lock:
+                latencies[op].append(elapsed)
+
+    def user(user_id: int) -> None:
+        rng = random.Random(seed + user_id + 1)
+        for _ in range(iterations):
+            timed("list_trips", lambda: list_trips(db))
+            trip = timed("get_trip", lambda: get_trip(db, trip_name)) or {}
+            participants = trip.get("participants", [])
+            expenses = timed("fetch_expenses", lambda: fetch_expenses(db, trip_name)) or []
+            timed("compute_balances", lambda: compute_balances(expenses, participants))
+            if participants and rng.random() < write_ratio:
+                expense = _random_expense(rng, participants)
+                timed("insert_expense", lambda: insert_expense(db, trip_name, expense))
+
+    started_at = datetime.now().isoformat()
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(user, range(users)))
+    wall = time.perf_counter() - wall_start
+
+    operations: Dict[str, Dict[str, Any]] = {}
+    for op in OPERATIONS:
+        samples = latencies.get(op, [])
+        operations[op] = {
+            "count": len(samples),
+            "errors": errors.get(op, 0),
+            "p50_ms": round(percentile(samples, 50), 3),
+            "p95_ms": round(percentile(samples, 95), 3),
+            "p99_ms": round(percentile(samples, 99), 3),
+            "max_ms": round(max(samples), 3) if samples else 0.0,
+            "busy_s": round(sum(samples) / 1000.0, 3),
+            "throughput_ops_s": round(len(samples) / wall, 2) if wall > 0 else 0.0,
+        }
+
+    return {
+        "started_at": started_at,
+        "trip_name": trip_name,
+        "users": users,
+        "iterations": iterations,
+        "write_ratio": write_ratio,
+        "wall_seconds": round(wall, 3),
+        "operations": operations,
+    }
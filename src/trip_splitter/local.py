@@ -0,0 +1,723 @@
+# src/trip_splitter/local.py
+from __future__ import annotations
+
+import json
+import random
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+from bson import ObjectId
+from pymongo import DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+try:
+    from .db import (
+        DEFAULT_CATEGORIES,
+        DUPLICATE_KEY_ERROR,
+        TRIP_CONFIG_COLLECTION,
+        ConflictError,
+        bump_data_version,
+        ensure_expense_indexes,
+        fetch_expenses,
+        list_trips,
+        new_client_id,
+        validate_trip_name,
+        version_filter,
+    )
+except ImportError:  # loaded as a flat module by the Streamlit script
+    from db import (
+        DEFAULT_CATEGORIES,
+        DUPLICATE_KEY_ERROR,
+        TRIP_CONFIG_COLLECTION,
+        ConflictError,
+        bump_data_version,
+        ensure_expense_indexes,
+        fetch_expenses,
+        list_trips,
+        new_client_id,
+        validate_trip_name,
+        version_filter,
+    )
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trips (
+    trip_name TEXT PRIMARY KEY,
+    doc TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS expenses (
+    trip_name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    doc TEXT NOT NULL,
+    PRIMARY KEY (trip_name, key)
+);
+CREATE TABLE IF NOT EXISTS journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    trip_name TEXT NOT NULL,
+    op TEXT NOT NULL,
+    key TEXT,
+    doc TEXT,
+    base_version INTEGER,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pulled (
+    trip_name TEXT PRIMARY KEY,
+    marker TEXT NOT NULL
+);
+"""
+
+
+def expense_key(expense: Dict[str, Any]) -> str:
+    """
+    Stable id for an expense across the local store and Mongo.
+
+    Expenses created through the journal always carry a `client_id`; older
+    documents that only have a Mongo ObjectId are keyed as "oid:<hex>".
+    """
+    if expense.get("client_id"):
+        return expense["client_id"]
+    return f"oid:{expense['_id']}"
+
+
+def _remote_filter(key: str) -> Dict[str, Any]:
+    if key.startswith("oid:"):
+        return {"_id": ObjectId(key[4:])}
+    return {"client_id": key}
+
+
+def _remote_marker(trip: Dict[str, Any]) -> str:
+    # Changes whenever the remote trip (or one of its expenses) is written,
+    # and when a trip is deleted and recreated under the same name.
+    return f"{trip.get('created_at', '')}:{trip.get('data_version', 0)}"
+
+
+class LocalStore:
+    """
+    Embedded SQLite mirror of the trips plus an append-only write journal.
+
+    All reads and writes hit the local file, so the app keeps working (and
+    stays fast) with no connection to Mongo. Every write is applied locally
+    and appended to `journal` in the same transaction; SyncWorker later
+    pushes journal entries after `synced_seq` to Mongo. Method names mirror
+    db.MongoStore so the app can use either one.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.RLock()
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+            if not self._meta_get("store_id"):
+                self._meta_set("store_id", random.getrandbits(62) or 1)
+            self.store_id = self._meta_get("store_id")
+
+    # ---------- META ----------
+
+    def _meta_get(self, key: str, default: int = 0) -> int:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return int(row[0]) if row else default
+
+    def _meta_set(self, key: str, value: int) -> None:
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value),
+        )
+
+    def _touch(self, trip_name: str) -> None:
+        key = f"version:{trip_name}"
+        self._meta_set(key, self._meta_get(key) + 1)
+
+    # ---------- READS ----------
+
+    def list_trips(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT doc FROM trips ORDER BY rowid").fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def get_trip(self, trip_name: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._get_trip(trip_name)
+
+    def _get_trip(self, trip_name: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(
+            "SELECT doc FROM trips WHERE trip_name = ?", (trip_name,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_data_version(self, trip_name: str) -> Optional[int]:
+        """Local change counter for the trip (bumped by local writes and pulls)."""
+        with self._lock:
+            if self._get_trip(trip_name) is None:
+                return None
+            return self._meta_get(f"version:{trip_name}")
+
+    def fetch_expenses(self, trip_name: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, doc FROM expenses WHERE trip_name = ? ORDER BY rowid",
+                (trip_name,),
+            ).fetchall()
+        out = []
+        for key, doc in rows:
+            expense = json.loads(doc)
+            expense["_id"] = key
+            out.append(expense)
+        return out
+
+    def _get_expense(self, trip_name: str, key: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(
+            "SELECT doc FROM expenses WHERE trip_name = ? AND key = ?", (trip_name, key)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # ---------- JOURNAL ----------
+
+    def _apply(
+        self,
+        trip_name: str,
+        op: str,
+        key: Optional[str],
+        doc: Optional[Dict[str, Any]],
+        touch: bool = True,
+    ) -> None:
+        """Apply one journal operation to the local tables."""
+        if op == "create_trip":
+            self._conn.execute(
+                "INSERT OR IGNORE INTO trips (trip_name, doc) VALUES (?, ?)",
+                (trip_name, json.dumps(doc)),
+            )
+        elif op == "add_participant":
+            trip = self._get_trip(trip_name)
+            if trip is not None and doc["participant"] not in trip.get("participants", []):
+                trip.setdefault("participants", []).append(doc["participant"])
+                self._conn.execute(
+                    "UPDATE trips SET doc = ? WHERE trip_name = ?",
+                    (json.dumps(trip), trip_name),
+                )
+        elif op == "insert":
+            self._conn.execute(
+                "INSERT OR IGNORE INTO expenses (trip_name, key, doc) VALUES (?, ?, ?)",
+                (trip_name, key, json.dumps(doc)),
+            )
+        elif op == "update":
+            expense = self._get_expense(trip_name, key)
+            if expense is not None:
+                expense.update(doc)
+                expense["version"] = int(expense.get("version", 0) or 0) + 1
+                self._conn.execute(
+                    "UPDATE expenses SET doc = ? WHERE trip_name = ? AND key = ?",
+                    (json.dumps(expense), trip_name, key),
+                )
+        elif op == "delete":
+            self._conn.execute(
+                "DELETE FROM expenses WHERE trip_name = ? AND key = ?", (trip_name, key)
+            )
+        else:
+            raise ValueError(f"Unknown journal op: {op}")
+        if touch:
+            self._touch(trip_name)
+
+    def _write(
+        self,
+        trip_name: str,
+        op: str,
+        key: Optional[str] = None,
+        doc: Optional[Dict[str, Any]] = None,
+        base_version: Optional[int] = None,
+    ) -> None:
+        # Caller holds the lock and the transaction
+        self._apply(trip_name, op, key, doc)
+        self._conn.execute(
+            "INSERT INTO journal (trip_name, op, key, doc, base_version, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                trip_name,
+                op,
+                key,
+                json.dumps(doc) if doc is not None else None,
+                base_version,
+                datetime.now().isoformat(),
+            ),
+        )
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """Journal entries not yet pushed to Mongo, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, trip_name, op, key, doc, base_version FROM journal "
+                "WHERE seq > ? ORDER BY seq",
+                (self._meta_get("synced_seq"),),
+            ).fetchall()
+        return [
+            {
+                "seq": seq,
+                "trip_name": trip_name,
+                "op": op,
+                "key": key,
+                "doc": json.loads(doc) if doc is not None else None,
+                "base_version": base_version,
+            }
+            for seq, trip_name, op, key, doc, base_version in rows
+        ]
+
+    def mark_synced(self, seq: int) -> None:
+        with self._lock, self._conn:
+            if seq > self._meta_get("synced_seq"):
+                self._meta_set("synced_seq", seq)
+
+    def pulled_markers(self) -> Dict[str, str]:
+        """Remote marker (created_at:data_version) of each trip as last pulled."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT trip_name, marker FROM pulled").fetchall())
+
+    def _fingerprint(self, trip_name: str) -> Any:
+        trip = self._conn.execute(
+            "SELECT doc FROM trips WHERE trip_name = ?", (trip_name,)
+        ).fetchone()
+        expenses = self._conn.execute(
+            "SELECT key, doc FROM expenses WHERE trip_name = ? ORDER BY key", (trip_name,)
+        ).fetchall()
+        return trip, expenses
+
+    def apply_remote(
+        self,
+        trips: List[Dict[str, Any]],
+        expenses_by_trip: Dict[str, List[Dict[str, Any]]],
+        markers: Dict[str, str],
+    ) -> None:
+        """
+        Merge a remote snapshot into the mirror.
+
+        `trips` is the full list of remote trip configs. `expenses_by_trip`
+        only holds trips whose remote marker moved (given in `markers`); the
+        others keep their local rows. Journal entries that have not been
+        pushed yet are replayed on top of refreshed trips, and trips created
+        locally but not pushed yet are kept, so local edits made during the
+        sync are not lost. A trip's local data version is only bumped if what
+        the app sees actually changed.
+        """
+        with self._lock, self._conn:
+            pending = self.pending()
+            unpushed = {e["trip_name"] for e in pending if e["op"] == "create_trip"}
+            remote_names = {t["trip_name"] for t in trips}
+            local_names = [
+                r[0] for r in self._conn.execute("SELECT trip_name FROM trips").fetchall()
+            ]
+            affected = remote_names | set(local_names)
+            before = {name: self._fingerprint(name) for name in affected}
+
+            for name in local_names:
+                if name not in remote_names and name not in unpushed:
+                    self._conn.execute("DELETE FROM trips WHERE trip_name = ?", (name,))
+                    self._conn.execute("DELETE FROM expenses WHERE trip_name = ?", (name,))
+                    self._conn.execute("DELETE FROM pulled WHERE trip_name = ?", (name,))
+            for trip in trips:
+                trip = {k: v for k, v in trip.items() if k != "_id"}
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO trips (trip_name, doc) VALUES (?, ?)",
+                    (trip["trip_name"], json.dumps(trip, default=str)),
+                )
+            for trip_name, expenses in expenses_by_trip.items():
+                self._conn.execute("DELETE FROM expenses WHERE trip_name = ?", (trip_name,))
+                for e in expenses:
+                    doc = {k: v for k, v in e.items() if k != "_id"}
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO expenses (trip_name, key, doc) VALUES (?, ?, ?)",
+                        (trip_name, expense_key(e), json.dumps(doc, default=str)),
+                    )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO pulled (trip_name, marker) VALUES (?, ?)",
+                    (trip_name, markers[trip_name]),
+                )
+
+            # Trip-level ops are idempotent; expense ops are only replayed on
+            # trips whose rows were just replaced (elsewhere they are still applied).
+            for entry in pending:
+                if entry["op"] in ("create_trip", "add_participant") or (
+                    entry["trip_name"] in expenses_by_trip
+                ):
+                    self._apply(
+                        entry["trip_name"], entry["op"], entry["key"], entry["doc"], touch=False
+                    )
+
+            for name in affected | {e["trip_name"] for e in pending}:
+                if self._fingerprint(name) != before.get(name):
+                    self._touch(name)
+
+    def rename_trip(self, old_name: str, new_name: str) -> None:
+        """
+        Move a trip, its expenses and its unpushed journal entries to
+        `new_name` (used when the name turned out to be taken remotely).
+        """
+        with self._lock, self._conn:
+            trip = self._get_trip(old_name)
+            if trip is None:
+                return
+            trip["trip_name"] = new_name
+            synced = self._meta_get("synced_seq")
+            self._conn.execute("DELETE FROM trips WHERE trip_name = ?", (old_name,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO trips (trip_name, doc) VALUES (?, ?)",
+                (new_name, json.dumps(trip, default=str)),
+            )
+            self._conn.execute(
+                "UPDATE expenses SET trip_name = ? WHERE trip_name = ?", (new_name, old_name)
+            )
+            self._conn.execute(
+                "UPDATE journal SET trip_name = ? WHERE trip_name = ? AND seq > ?",
+                (new_name, old_name, synced),
+            )
+            self._conn.execute(
+                "UPDATE journal SET doc = ? WHERE trip_name = ? AND op = 'create_trip' AND seq > ?",
+                (json.dumps(trip, default=str), new_name, synced),
+            )
+            self._conn.execute("DELETE FROM pulled WHERE trip_name = ?", (old_name,))
+            self._touch(old_name)
+            self._touch(new_name)
+
+    # ---------- WRITES ----------
+
+    def create_trip(
+        self,
+        trip_name: str,
+        participants: Iterable[str],
+        categories: Optional[Iterable[str]] = None,
+    ) -> Dict[str, Any]:
+        validate_trip_name(trip_name)
+        trip = {
+            "trip_name": trip_name,
+            "participants": list(participants),
+            "categories": list(categories) if categories is not None else list(DEFAULT_CATEGORIES),
+            "created_at": datetime.now().isoformat(),
+            "data_version": 0,
+        }
+        with self._lock, self._conn:
+            if self._get_trip(trip_name) is not None:
+                raise ValueError("A trip with this name already exists. Choose a different name.")
+            self._write(trip_name, "create_trip", doc=trip)
+        return trip
+
+    def add_participant(self, trip_name: str, participant: str) -> None:
+        with self._lock, self._conn:
+            self._write(trip_name, "add_participant", doc={"participant": participant})
+
+    def insert_expense(self, trip_name: str, expense: Dict[str, Any]) -> Dict[str, Any]:
+        expense = dict(expense)
+        expense.setdefault("client_id", new_client_id())
+        expense.setdefault("version", 1)
+        with self._lock, self._conn:
+            if self._get_expense(trip_name, expense["client_id"]) is None:
+                self._write(trip_name, "insert", key=expense["client_id"], doc=expense)
+        expense["_id"] = expense["client_id"]
+        return expense
+
+    def insert_expenses(self, trip_name: str, expenses: List[Dict[str, Any]]) -> int:
+        inserted = 0
+        with self._lock, self._conn:
+            for e in expenses:
+                e = dict(e)
+                e.setdefault("client_id", new_client_id())
+                e.setdefault("version", 1)
+                if self._get_expense(trip_name, e["client_id"]) is None:
+                    self._write(trip_name, "insert", key=e["client_id"], doc=e)
+                    inserted += 1
+        return inserted
+
+    def update_expense(
+        self,
+        trip_name: str,
+        expense_id: str,
+        fields: Dict[str, Any],
+        expected_version: Optional[int] = None,
+    ) -> bool:
+        fields = {k: v for k, v in fields.items() if k not in ("_id", "version", "client_id")}
+        with self._lock, self._conn:
+            expense = self._get_expense(trip_name, expense_id)
+            if expense is None:
+                return False
+            current = int(expense.get("version", 0) or 0)
+            if expected_version is not None and current != expected_version:
+                raise ConflictError("This expense was changed by someone else. Reload and try again.")
+            self._write(trip_name, "update", key=expense_id, doc=fields, base_version=current)
+        return True
+
+    def delete_expense(
+        self,
+        trip_name: str,
+        expense_id: str,
+        expected_version: Optional[int] = None,
+    ) -> bool:
+        with self._lock, self._conn:
+            expense = self._get_expense(trip_name, expense_id)
+            if expense is None:
+                return False
+            current = int(expense.get("version", 0) or 0)
+            if expected_version is not None and current != expected_version:
+                raise ConflictError("This expense was changed by someone else. Reload and try again.")
+            self._write(trip_name, "delete", key=expense_id, base_version=current)
+        return True
+
+
+# ---------- SYNC ----------
+
+def _bulk_upsert(collection, ops: List[Any]) -> None:
+    try:
+        collection.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        # Concurrent upserts on the same client_id: the expense is stored either way
+        if any(err.get("code") != DUPLICATE_KEY_ERROR for err in e.details.get("writeErrors", [])):
+            raise
+
+
+def _claim_trip_name(store: LocalStore, config, trip_name: str, doc: Dict[str, Any]) -> str:
+    """
+    Create a locally made trip in Mongo and return the name it got.
+
+    `created_at` tells our trip apart from one another group created under
+    the same name while we were offline. Merging into theirs would hand our
+    expenses to strangers, so we take the first free "name (n)" instead.
+    """
+    name, n = trip_name, 1
+    while True:
+        if name == trip_name or store.get_trip(name) is None:
+            try:
+                config.update_one(
+                    {"trip_name": name}, {"$setOnInsert": dict(doc, trip_name=name)}, upsert=True
+                )
+            except DuplicateKeyError:
+                pass  # someone created it just now; the check below sees whose it is
+            remote = config.find_one({"trip_name": name}, {"_id": 0, "created_at": 1})
+            if remote is not None and remote.get("created_at") == doc.get("created_at"):
+                return name
+        n += 1
+        name = f"{trip_name} ({n})"
+
+
+def push_journal(
+    store: LocalStore,
+    db,
+    on_rename: Optional[Callable[[str, str], None]] = None,
+) -> int:
+    """
+    Push pending journal entries to Mongo and return the number of conflicts.
+
+    A trip created offline whose name was meanwhile taken by a different
+    remote trip is renamed (see _claim_trip_name); `on_rename(old, new)` is
+    called for it.
+
+    Per trip, expense entries are folded into one op per expense:
+      - inserts are upserts keyed on client_id (safe to resend);
+      - all pending updates/deletes of one expense become a single
+        conditional op on the version the *first* of them started from.
+        It sets `last_op` to an id unique to this store and journal position.
+    If someone else changed the expense first, the version no longer
+    matches. Their change wins and every local edit of that expense in this
+    push is dropped. Each such expense counts as one conflict, and the
+    next pull brings the remote copy back. Each kind of op goes out as its
+    own bulk_write. A shortfall is resolved per expense: an update counts as
+    applied if `last_op` is ours (e.g. a resend after a crash before
+    mark_synced), and a delete counts as applied if the expense is gone.
+
+    Known gap: after such a crash, if new local edits of the same expense
+    were made before the resend, they fold into a different op id and are
+    counted as a conflict.
+    """
+    entries = store.pending()
+    if not entries:
+        return 0
+
+    config = db[TRIP_CONFIG_COLLECTION]
+    plans: Dict[str, Dict[str, Any]] = {}
+    renamed: Dict[str, str] = {}
+    for entry in entries:
+        trip_name, op, key, doc = entry["trip_name"], entry["op"], entry["key"], entry["doc"]
+        trip_name = renamed.get(trip_name, trip_name)
+        if op == "create_trip":
+            claimed = _claim_trip_name(store, config, trip_name, doc)
+            if claimed != trip_name:
+                store.rename_trip(trip_name, claimed)
+                renamed[trip_name] = claimed
+                if on_rename is not None:
+                    on_rename(trip_name, claimed)
+            continue
+        if op == "add_participant":
+            config.update_one(
+                {"trip_name": trip_name},
+                {"$addToSet": {"participants": doc["participant"]}, "$inc": {"data_version": 1}},
+            )
+            continue
+
+        plan = plans.setdefault(trip_name, {"inserts": [], "conditional": {}})
+        if op == "insert":
+            plan["inserts"].append(
+                UpdateOne(
+                    {"client_id": key},
+                    {"$setOnInsert": {k: v for k, v in doc.items() if k != "client_id"}},
+                    upsert=True,
+                )
+            )
+            continue
+
+        cond = plan["conditional"].setdefault(
+            key, {"op": "update", "base": entry["base_version"], "fields": {}, "edits": 0}
+        )
+        cond["op_id"] = f"{store.store_id}:{entry['seq']}"
+        if op == "update":
+            cond["fields"].update(doc)
+            cond["edits"] += 1
+        elif op == "delete":
+            cond["op"] = "delete"
+
+    conflicts = 0
+    for trip_name, plan in plans.items():
+        collection = db[trip_name]
+        ensure_expense_indexes(db, trip_name)
+        bump_data_version(db, trip_name)
+
+        if plan["inserts"]:
+            _bulk_upsert(collection, plan["inserts"])
+
+        updates = [(k, c) for k, c in plan["conditional"].items() if c["op"] == "update"]
+        if updates:
+            result = collection.bulk_write(
+                [
+                    UpdateOne(
+                        dict(_remote_filter(k), **version_filter(c["base"])),
+                        {
+                            "$set": dict(c["fields"], last_op=c["op_id"]),
+                            "$inc": {"version": c["edits"]},
+                        },
+                    )
+                    for k, c in updates
+                ],
+                ordered=False,
+            )
+            if result.matched_count < len(updates):
+                for k, c in updates:
+                    remote = collection.find_one(_remote_filter(k), {"last_op": 1})
+                    if remote is None or remote.get("last_op") != c["op_id"]:
+                        conflicts += 1
+
+        deletes = [(k, c) for k, c in plan["conditional"].items() if c["op"] == "delete"]
+        if deletes:
+            result = collection.bulk_write(
+                [DeleteOne(dict(_remote_filter(k), **version_filter(c["base"]))) for k, c in deletes],
+                ordered=False,
+            )
+            if result.deleted_count < len(deletes):
+                for k, _ in deletes:
+                    if collection.find_one(_remote_filter(k), {"_id": 1}) is not None:
+                        conflicts += 1
+
+        bump_data_version(db, trip_name)
+
+    store.mark_synced(entries[-1]["seq"])
+    return conflicts
+
+
+def pull_remote(store: LocalStore, db) -> None:
+    """
+    Refresh the local mirror from Mongo. Trip configs are always read (one
+    small query); expenses are only re-read for trips whose remote
+    data_version (or incarnation) moved since the last pull.
+    """
+    trips = list_trips(db)
+    known = store.pulled_markers()
+    expenses: Dict[str, List[Dict[str, Any]]] = {}
+    markers: Dict[str, str] = {}
+    for trip in trips:
+        marker = _remote_marker(trip)
+        if known.get(trip["trip_name"]) != marker:
+            expenses[trip["trip_name"]] = fetch_expenses(db, trip["trip_name"])
+            markers[trip["trip_name"]] = marker
+    store.apply_remote(trips, expenses, markers)
+
+
+class SyncWorker(threading.Thread):
+    """
+    Background thread that merges the local journal into Mongo whenever it
+    is reachable. `connect` returns a database handle (or raises if Mongo is
+    down); any PyMongoError/OSError just marks the worker offline until the
+    next attempt. Use a client with a short server-selection timeout so an
+    offline attempt fails fast.
+    """
+
+    def __init__(self, store: LocalStore, connect: Callable[[], Any], interval: float = 10.0):
+        super().__init__(daemon=True, name="trip-splitter-sync")
+        self.store = store
+        self.connect = connect
+        self.interval = interval
+        self.online = False
+        self.last_sync: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.conflicts = 0
+        # Offline-created trips that had to be renamed on push: old -> new name
+        self.renamed: Dict[str, str] = {}
+        self._stop_event = threading.Event()
+        self._wake = threading.Event()
+        self._sync_lock = threading.Lock()
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            self.sync_once()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def request_sync(self) -> None:
+        """Ask the thread to sync now without waiting for it (UI-safe)."""
+        self._wake.set()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self._wake.set()
+
+    def sync_once(self) -> bool:
+        """Push the journal, then pull remote state. Returns True on success."""
+        with self._sync_lock:
+            try:
+                db = self.connect()
+                self.conflicts += push_journal(self.store, db, on_rename=self.renamed.__setitem__)
+                pull_remote(self.store, db)
+            except (PyMongoError, OSError) as e:
+                self.online = False
+                self.last_error = str(e)
+                return False
+            self.online = True
+            self.last_error = None
+            self.last_sync = datetime.now().isoformat()
+            return True
+
+
+_stores: Dict[str, LocalStore] = {}
+_workers: Dict[str, SyncWorker] = {}
+_registry_lock = threading.Lock()
+
+
+def get_local_store(path: Union[str, Path]) -> LocalStore:
+    """Process-wide LocalStore for `path` (shared across Streamlit reruns)."""
+    key = str(Path(path).resolve())
+    with _registry_lock:
+        if key not in _stores:
+            _stores[key] = LocalStore(path)
+        return _stores[key]
+
+
+def start_sync(
+    store: LocalStore, connect: Callable[[], Any], interval: float = 10.0
+) -> SyncWorker:
+    """Start (once per store) and return the background SyncWorker."""
+    key = str(id(store))
+    with _registry_lock:
+        worker = _workers.get(key)
+        if worker is None or not worker.is_alive():
+            worker = SyncWorker(store, connect, interval)
+            worker.start()
+            _workers[key] = worker
+        return worker
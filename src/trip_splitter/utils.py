@@ -1,8 +1,10 @@
 # src/trip_splitter/utils.py
 from __future__ import annotations
 
-from collections import defaultdict
-from typing import Any, Dict, Iterable, List, Tuple
+import json
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 
 
 def compute_aggregates(
@@ -76,14 +78,17 @@ def optimize_settlements(balances: Dict[str, float]) -> List[Tuple[str, str, flo
     Same greedy algorithm as your original code:
     Takes balances dict (positive -> should receive, negative -> owes)
     Returns list of (debtor, creditor, amount)
+
+    Ties are broken by name, so the output depends only on the balances and
+    not on participant order.
     """
     creditors = {k: v for k, v in balances.items() if v > 0}
     debtors = {k: -v for k, v in balances.items() if v < 0}
     txns: List[Tuple[str, str, float]] = []
 
-    # sort by amount descending
-    creditors = dict(sorted(creditors.items(), key=lambda x: -x[1]))
-    debtors = dict(sorted(debtors.items(), key=lambda x: -x[1]))
+    # sort by amount descending, then name
+    creditors = dict(sorted(creditors.items(), key=lambda x: (-x[1], x[0])))
+    debtors = dict(sorted(debtors.items(), key=lambda x: (-x[1], x[0])))
 
     for d in debtors:
         for c in creditors:
@@ -98,3 +103,161 @@ def optimize_settlements(balances: Dict[str, float]) -> List[Tuple[str, str, flo
                 creditors[c] -= amt
 
     return txns
+
+
+def order_settlements(
+    txns: Iterable[Tuple[str, str, float]],
+    order: Optional[Sequence[str]] = None,
+) -> List[Tuple[str, str, float]]:
+    """
+    Sort settlements by debtor, then creditor, using the rank of each name
+    in `order` (e.g. the trip's participant list; unknown names go last,
+    by name). The rank is fixed, so a payment that survives a balance
+    change keeps its place relative to the others.
+
+    Only the ordering is stable: the greedy pairing itself may change when
+    balances change, so a payment can still appear, vanish or change amount.
+    """
+    rank = {p: i for i, p in enumerate(order or [])}
+
+    def position(name: str) -> Tuple[int, str]:
+        return (rank.get(name, len(rank)), name)
+
+    return sorted(txns, key=lambda t: (position(t[0]), position(t[1])))
+
+
+def expense_deltas(
+    expense: Dict[str, Any],
+    participants: Iterable[str],
+) -> Dict[str, float]:
+    """
+    Balance change caused by a single expense, using the same rules as
+    compute_aggregates (payer +amount, each included person -share).
+    Lets callers update balances incrementally instead of recomputing.
+    """
+    amount = float(expense["amount"])
+    included = expense.get("included", list(participants))
+    deltas: Dict[str, float] = defaultdict(float)
+
+    deltas[expense["paid_by"]] += amount
+    if included:
+        share = amount / len(included)
+        for p in included:
+            deltas[p] -= share
+
+    return dict(deltas)
+
+
+def apply_deltas(
+    balances: Dict[str, float],
+    deltas: Dict[str, float],
+) -> Dict[str, float]:
+    """Return a new balances dict with `deltas` added (rounded like compute_balances)."""
+    out = dict(balances)
+    for p, d in deltas.items():
+        out[p] = round(out.get(p, 0.0) + d, 2)
+    return out
+
+
+def settlement_key(balances: Dict[str, float]) -> Tuple[Tuple[str, float], ...]:
+    """
+    Canonical form of a balance vector: rounded to paise, settled people
+    dropped, sorted by name. Balances that produce the same settlements
+    map to the same key.
+    """
+    return tuple(
+        sorted((p, round(b, 2)) for p, b in balances.items() if round(b, 2) != 0)
+    )
+
+
+class SettlementCache:
+    """
+    LRU cache of optimize_settlements results keyed on settlement_key().
+
+    One instance is shared by every session in the process (see
+    `settlement_cache`). Pass `persist` to get() to also read/write a
+    persistent store, e.g. db.SettlementStore for finished trips whose
+    balances won't change. Any object with `load(key)` (returning the stored
+    transactions or None) and `save(key, transactions)` works; keys are
+    strings.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._entries: OrderedDict = OrderedDict()
+        self._persisted: set = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    def get(
+        self,
+        balances: Dict[str, float],
+        persist: Optional[Any] = None,
+        order: Optional[Sequence[str]] = None,
+    ) -> List[Tuple[str, str, float]]:
+        """Settlements for `balances`, sorted with order_settlements(order)."""
+        return order_settlements(self._lookup(balances, persist), order)
+
+    def _lookup(self, balances: Dict[str, float], persist: Optional[Any]):
+        key = settlement_key(balances)
+        key_str = json.dumps(key)
+        with self._lock:
+            txns = self._entries.get(key)
+            if txns is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if txns is not None:
+            if persist is not None and key not in self._persisted:
+                persist.save(key_str, txns)
+                self._persisted.add(key)
+            return txns
+
+        if persist is not None:
+            stored = persist.load(key_str)
+            if stored is not None:
+                txns = [tuple(t) for t in stored]
+                self._persisted.add(key)
+
+        with self._lock:
+            if txns is not None:
+                self.persistent_hits += 1
+            else:
+                self.misses += 1
+
+        if txns is None:
+            txns = optimize_settlements(dict(key))
+            if persist is not None:
+                persist.save(key_str, txns)
+                self._persisted.add(key)
+
+        with self._lock:
+            self._entries[key] = txns
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                evicted, _ = self._entries.popitem(last=False)
+                self._persisted.discard(evicted)
+        return txns
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._persisted.clear()
+            self.hits = self.persistent_hits = self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.persistent_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.persistent_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Process-wide cache shared by all Streamlit sessions / API requests
+settlement_cache = SettlementCache()
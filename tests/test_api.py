@@ -0,0 +1,126 @@
+# tests/test_api.py
+from __future__ import annotations
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from trip_splitter.api import create_app  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    return TestClient(create_app(mongomock.MongoClient()["Trips"]))
+
+
+def test_conditional_get_returns_304_until_data_changes(client):
+    client.post("/trips", json={"trip_name": "Goa", "participants": ["A", "B"]})
+    etag = client.get("/trips/Goa/balances").headers["etag"]
+
+    assert client.get("/trips/Goa/balances", headers={"If-None-Match": etag}).status_code == 304
+
+    client.post("/trips/Goa/expenses", json={"paid_by": "A", "amount": 100, "category": "Food"})
+    assert client.get("/trips/Goa/balances", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_recreated_trip_does_not_reuse_etag(client):
+    client.post("/trips", json={"trip_name": "Goa", "participants": ["A", "B"]})
+    etag = client.get("/trips/Goa").headers["etag"]
+
+    client.delete("/trips/Goa")
+    client.post("/trips", json={"trip_name": "Goa", "participants": ["C", "D"]})
+
+    r = client.get("/trips/Goa", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.json()["participants"] == ["C", "D"]
+
+
+def test_non_latin1_trip_name(client):
+    name = "గోవా ట్రిప్"
+    assert client.post("/trips", json={"trip_name": name, "participants": ["A"]}).status_code == 201
+    r = client.get(f"/trips/{name}/balances")
+    assert r.status_code == 200
+    assert r.headers["etag"].isascii()
+
+
+@pytest.mark.parametrize(
+    "name", ["Trip_names", "Settlement_cache", "   ", "system.profile", "a$b", "a\0b"]
+)
+def test_unusable_trip_names_are_rejected(client, name):
+    client.post("/trips", json={"trip_name": "Goa", "participants": ["A"]})
+
+    r = client.post("/trips", json={"trip_name": name, "participants": ["A"]})
+    assert r.status_code == 422
+    assert [t["trip_name"] for t in client.get("/trips").json()] == ["Goa"]
+
+
+def test_blank_participant_is_rejected(client):
+    client.post("/trips", json={"trip_name": "Goa", "participants": ["A", "B"]})
+
+    assert client.post("/trips/Goa/participants", json={"name": "   "}).status_code == 422
+    assert client.get("/trips/Goa").json()["participants"] == ["A", "B"]
+
+
+def test_cannot_remove_participant_used_in_expenses(client):
+    client.post("/trips", json={"trip_name": "Goa", "participants": ["A", "B", "C"]})
+    client.post(
+        "/trips/Goa/expenses",
+        json={"paid_by": "A", "amount": 100, "category": "Food", "included": ["A", "B"]},
+    )
+
+    version = client.get("/trips/Goa").json()["data_version"]
+    r = client.patch("/trips/Goa", json={"participants": ["B"], "data_version": version})
+    assert r.status_code == 409
+    assert "A" in r.json()["detail"]
+    assert client.get("/trips/Goa").json()["participants"] == ["A", "B", "C"]
+
+    r = client.patch(
+        "/trips/Goa", json={"participants": ["A", " B ", "B"], "data_version": version}
+    )
+    assert r.status_code == 200
+    assert r.json()["participants"] == ["A", "B"]
+
+
+def test_expense_writes_must_be_conditional(client):
+    client.post("/trips", json={"trip_name": "Goa", "participants": ["A", "B"]})
+    expense = client.post(
+        "/trips/Goa/expenses", json={"paid_by": "A", "amount": 100, "category": "Food"}
+    ).json()
+    url = f"/trips/Goa/expenses/{expense['_id']}"
+
+    assert client.patch(url, json={"amount": 50}).status_code == 428
+    assert client.delete(url).status_code == 428
+
+    assert client.patch(url, json={"amount": 50, "version": 1}).status_code == 200
+    r = client.patch(url, json={"amount": 70, "version": 1})
+    assert r.status_code == 409
+    assert client.delete(url, params={"version": 1}).status_code == 409
+    assert client.get(url).json()["amount"] == 50
+
+    stale = client.get("/trips/Goa").headers["etag"]
+    client.post("/trips/Goa/expenses", json={"paid_by": "B", "amount": 10, "category": "Food"})
+    assert client.patch(url, json={"amount": 60}, headers={"If-Match": stale}).status_code == 412
+    fresh = client.get("/trips/Goa").headers["etag"]
+    assert client.patch(url, json={"amount": 60}, headers={"If-Match": fresh}).status_code == 200
+    assert client.delete(url, params={"version": 3}).status_code == 204
+
+
+def test_trip_writes_must_be_conditional(client):
+    client.post("/trips", json={"trip_name": "Goa", "participants": ["A"]})
+    trip = client.get("/trips/Goa")
+    version, etag = trip.json()["data_version"], trip.headers["etag"]
+
+    assert client.patch("/trips/Goa", json={"categories": ["Food"]}).status_code == 428
+    assert client.post("/trips/Goa/participants", json={"name": "B"}).status_code == 428
+
+    r = client.post("/trips/Goa/participants", json={"name": "B", "data_version": version})
+    assert r.status_code == 200
+    r = client.post("/trips/Goa/participants", json={"name": "C", "data_version": version})
+    assert r.status_code == 409
+    r = client.patch("/trips/Goa", json={"categories": ["Food"]}, headers={"If-Match": etag})
+    assert r.status_code == 412
+    assert client.get("/trips/Goa").json()["participants"] == ["A", "B"]
@@ -0,0 +1,126 @@
+# tests/test_db.py
+from __future__ import annotations
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from pymongo.errors import AutoReconnect, DuplicateKeyError, OperationFailure  # noqa: E402
+
+from trip_splitter import db as tdb  # noqa: E402
+from trip_splitter.utils import SettlementCache  # noqa: E402
+
+
+@pytest.fixture
+def mdb():
+    database = mongomock.MongoClient()["Trips"]
+    tdb.create_trip(database, "Goa", ["A", "B"])
+    return database
+
+
+def _draft(amount: float, client_id: str):
+    expense = tdb.make_expense("A", amount, "x", "Food", ["A", "B"])
+    expense["client_id"] = client_id
+    return expense
+
+
+def test_insert_expenses_is_idempotent(mdb):
+    batch = [_draft(10, "k1"), _draft(20, "k2")]
+    assert tdb.insert_expenses(mdb, "Goa", batch) == 2
+    assert tdb.insert_expenses(mdb, "Goa", batch) == 0
+    assert len(tdb.fetch_expenses(mdb, "Goa")) == 2
+
+
+def test_insert_expenses_retries_only_transient_errors(mdb, monkeypatch):
+    collection_cls = type(mdb["Goa"])
+    real_bulk_write = collection_cls.bulk_write
+    calls = []
+
+    def flaky(self, ops, ordered=True):
+        calls.append(1)
+        if len(calls) == 1:
+            raise AutoReconnect("connection reset")
+        return real_bulk_write(self, ops, ordered=ordered)
+
+    monkeypatch.setattr(collection_cls, "bulk_write", flaky)
+    assert tdb.insert_expenses(mdb, "Goa", [_draft(10, "k1")], backoff=0) == 1
+    assert len(calls) == 2
+
+    calls.clear()
+
+    def permanent(self, ops, ordered=True):
+        calls.append(1)
+        raise OperationFailure("not authorized", code=13)
+
+    monkeypatch.setattr(collection_cls, "bulk_write", permanent)
+    with pytest.raises(OperationFailure):
+        tdb.insert_expenses(mdb, "Goa", [_draft(20, "k2")], backoff=0)
+    assert len(calls) == 1
+
+
+def test_conditional_update_reports_conflict(mdb):
+    expense = tdb.insert_expense(mdb, "Goa", tdb.make_expense("A", 10, "x", "Food", ["A"]))
+    assert tdb.update_expense(mdb, "Goa", expense["_id"], {"amount": 20.0}, expected_version=1)
+    with pytest.raises(tdb.ConflictError):
+        tdb.update_expense(mdb, "Goa", expense["_id"], {"amount": 30.0}, expected_version=1)
+    assert tdb.get_expense(mdb, "Goa", expense["_id"])["amount"] == 20.0
+
+
+def test_ensure_indexes_reports_existing_duplicates():
+    database = mongomock.MongoClient()["Trips"]
+    database[tdb.TRIP_CONFIG_COLLECTION].insert_many(
+        [{"trip_name": "Goa"}, {"trip_name": "Goa"}, {"trip_name": "Vizag"}]
+    )
+    assert tdb.ensure_indexes(database) == ["Goa"]
+
+    database[tdb.TRIP_CONFIG_COLLECTION].delete_one({"trip_name": "Goa"})
+    assert tdb.ensure_indexes(database) == []
+    with pytest.raises(ValueError):
+        tdb.create_trip(database, "Vizag", ["A"])
+
+
+def test_settlement_cache_key_is_unique():
+    database = mongomock.MongoClient()["Trips"]
+    cache = database[tdb.SETTLEMENT_CACHE_COLLECTION]
+    cache.insert_many([{"key": "k", "transactions": []}, {"key": "k", "transactions": []}])
+    assert tdb.ensure_indexes(database) == []
+    assert cache.count_documents({"key": "k"}) == 1
+
+    with pytest.raises(DuplicateKeyError):
+        cache.insert_one({"key": "k", "transactions": []})
+
+    # Losing an upsert race on the unique key is not an error: the winner
+    # stored the same settlements.
+    class RacingCollection:
+        def find_one(self, *args, **kwargs):
+            return None
+
+        def update_one(self, *args, **kwargs):
+            raise DuplicateKeyError("E11000 duplicate key")
+
+    store = tdb.SettlementStore(database)
+    store.collection = RacingCollection()
+    settlements = SettlementCache()
+    assert settlements.get({"A": 10.0, "B": -10.0}, persist=store) == [("B", "A", 10.0)]
+
+
+def test_settlement_store_round_trip():
+    database = mongomock.MongoClient()["Trips"]
+    store = tdb.SettlementStore(database)
+    balances = {"A": 10.0, "B": -10.0}
+
+    SettlementCache().get(balances, persist=store)
+    # A fresh process finds the result in Mongo instead of recomputing it
+    fresh = SettlementCache()
+    assert fresh.get(balances, persist=store) == [("B", "A", 10.0)]
+    assert fresh.stats()["persistent_hits"] == 1 and fresh.stats()["misses"] == 0
+
+
+def test_recreated_trip_keeps_client_id_index(mdb):
+    tdb.insert_expense(mdb, "Goa", _draft(10, "k1"))
+    tdb.delete_trip(mdb, "Goa")
+    tdb.create_trip(mdb, "Goa", ["A", "B"])
+
+    tdb.insert_expense(mdb, "Goa", _draft(10, "k1"))
+    tdb.insert_expense(mdb, "Goa", _draft(10, "k1"))
+    assert len(tdb.fetch_expenses(mdb, "Goa")) == 1
@@ -0,0 +1,45 @@
+# tests/test_loadtest.py
+from __future__ import annotations
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from trip_splitter import db as tdb  # noqa: E402
+from trip_splitter.loadtest import OPERATIONS, percentile, run_loadtest, seed_trip  # noqa: E402
+
+
+def test_percentile_nearest_rank():
+    samples = [5.0, 1.0, 4.0, 2.0, 3.0]
+    assert percentile([], 50) == 0.0
+    assert percentile(samples, 50) == 3.0
+    assert percentile(samples, 95) == 5.0
+    assert percentile(samples, 1) == 1.0
+
+
+def test_seed_trip_refuses_existing_trip():
+    database = mongomock.MongoClient()["TripsLoadtest"]
+    tdb.create_trip(database, "Goa", ["A"])
+    with pytest.raises(ValueError):
+        seed_trip(database, "Goa", ["P1", "P2"], 5)
+    assert tdb.get_trip(database, "Goa")["participants"] == ["A"]
+
+    seed_trip(database, "Goa", ["P1", "P2"], 5, force=True)
+    assert len(tdb.fetch_expenses(database, "Goa")) == 5
+
+
+def test_run_loadtest_report():
+    database = mongomock.MongoClient()["TripsLoadtest"]
+    seed_trip(database, "loadtest", ["P1", "P2", "P3"], 20)
+
+    report = run_loadtest(database, "loadtest", users=3, iterations=4, write_ratio=1.0)
+
+    assert report["users"] == 3 and report["iterations"] == 4
+    assert set(report["operations"]) == set(OPERATIONS)
+    for op in OPERATIONS:
+        stats = report["operations"][op]
+        assert stats["count"] == 12
+        assert stats["errors"] == 0
+        assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"] <= stats["max_ms"]
+        assert stats["busy_s"] >= 0
+    assert len(tdb.fetch_expenses(database, "loadtest")) == 20 + 12
@@ -0,0 +1,143 @@
+# tests/test_local.py
+from __future__ import annotations
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from pymongo.errors import ServerSelectionTimeoutError  # noqa: E402
+
+from trip_splitter import db as tdb  # noqa: E402
+from trip_splitter import local  # noqa: E402
+
+
+@pytest.fixture
+def remote():
+    database = mongomock.MongoClient()["Trips"]
+    tdb.create_trip(database, "Goa", ["A", "B"])
+    expense = tdb.make_expense("A", 10, "x", "Food", ["A", "B"])
+    expense["client_id"] = "k1"
+    tdb.insert_expense(database, "Goa", expense)
+    return database
+
+
+@pytest.fixture
+def link(remote):
+    """Connect callable for SyncWorker; flip `link.up` to simulate losing signal."""
+
+    def connect():
+        if not connect.up:
+            raise ServerSelectionTimeoutError("offline")
+        return remote
+
+    connect.up = True
+    return connect
+
+
+@pytest.fixture
+def worker(tmp_path, link):
+    store = local.LocalStore(tmp_path / "local.db")
+    sync = local.SyncWorker(store, link)
+    assert sync.sync_once()
+    return sync
+
+
+def _amount(expenses, key="k1"):
+    return next(e["amount"] for e in expenses if e.get("client_id") == key)
+
+
+def test_offline_insert_is_pushed_on_sync(worker, link, remote):
+    link.up = False
+    expense = tdb.make_expense("B", 30, "y", "Fuel", ["A", "B"])
+    worker.store.insert_expense("Goa", expense)
+    assert not worker.sync_once()
+    assert len(worker.store.pending()) == 1
+
+    link.up = True
+    assert worker.sync_once()
+    assert worker.store.pending() == []
+    assert len(tdb.fetch_expenses(remote, "Goa")) == 2
+
+
+def test_remote_edit_wins_over_all_offline_edits_of_same_expense(worker, link, remote):
+    link.up = False
+    worker.store.update_expense("Goa", "k1", {"amount": 20.0}, expected_version=1)
+    worker.store.update_expense("Goa", "k1", {"amount": 30.0}, expected_version=2)
+    # Someone else edits the same expense while we are offline
+    remote_id = remote["Goa"].find_one({"client_id": "k1"})["_id"]
+    tdb.update_expense(remote, "Goa", remote_id, {"amount": 99.0}, expected_version=1)
+
+    link.up = True
+    assert worker.sync_once()
+    assert worker.conflicts == 1
+    assert _amount(tdb.fetch_expenses(remote, "Goa")) == 99.0
+    assert _amount(worker.store.fetch_expenses("Goa")) == 99.0
+
+
+def test_resending_journal_is_not_a_conflict(worker, remote):
+    worker.store.update_expense("Goa", "k1", {"amount": 20.0}, expected_version=1)
+    worker.store.insert_expense("Goa", tdb.make_expense("B", 5, "z", "Misc", ["B"]))
+    assert worker.sync_once()
+
+    # Crash between push and mark_synced: the same entries go out again
+    with worker.store._lock, worker.store._conn:
+        worker.store._meta_set("synced_seq", 0)
+    assert worker.sync_once()
+
+    assert worker.conflicts == 0
+    expenses = tdb.fetch_expenses(remote, "Goa")
+    assert len(expenses) == 2
+    assert _amount(expenses) == 20.0
+    assert next(e for e in expenses if e["client_id"] == "k1")["version"] == 2
+
+
+def test_idle_sync_does_not_bump_or_refetch(worker, remote, monkeypatch):
+    worker.sync_once()
+    local_version = worker.store.get_data_version("Goa")
+    remote_version = tdb.get_data_version(remote, "Goa")
+
+    fetched = []
+    real_fetch = local.fetch_expenses
+    monkeypatch.setattr(
+        local, "fetch_expenses", lambda db, name: fetched.append(name) or real_fetch(db, name)
+    )
+    assert worker.sync_once()
+    assert worker.sync_once()
+    assert fetched == []
+    assert worker.store.get_data_version("Goa") == local_version
+    assert tdb.get_data_version(remote, "Goa") == remote_version
+
+    tdb.create_trip(remote, "Ooty", ["C"])
+    tdb.insert_expense(remote, "Goa", tdb.make_expense("B", 7, "w", "Food", ["A", "B"]))
+    assert worker.sync_once()
+    assert sorted(fetched) == ["Goa", "Ooty"]
+    assert worker.store.get_data_version("Goa") > local_version
+    assert len(worker.store.fetch_expenses("Goa")) == 2
+
+
+def test_pull_keeps_trip_created_locally_but_not_pushed(worker, remote):
+    worker.store.create_trip("Ooty", ["C", "D"])
+    worker.store.insert_expense("Ooty", tdb.make_expense("C", 40, "tea", "Food", ["C", "D"]))
+
+    local.pull_remote(worker.store, remote)
+
+    assert worker.store.get_trip("Ooty")["participants"] == ["C", "D"]
+    assert len(worker.store.fetch_expenses("Ooty")) == 1
+
+
+def test_offline_trip_is_not_merged_into_remote_trip_of_same_name(worker, link, remote):
+    link.up = False
+    worker.store.create_trip("Ooty", ["C", "D"])
+    worker.store.insert_expense("Ooty", tdb.make_expense("C", 40, "tea", "Food", ["C", "D"]))
+    tdb.create_trip(remote, "Ooty", ["X", "Y"])
+
+    link.up = True
+    assert worker.sync_once()
+
+    assert worker.renamed == {"Ooty": "Ooty (2)"}
+    assert tdb.get_trip(remote, "Ooty")["participants"] == ["X", "Y"]
+    assert tdb.fetch_expenses(remote, "Ooty") == []
+    assert tdb.get_trip(remote, "Ooty (2)")["participants"] == ["C", "D"]
+    assert len(tdb.fetch_expenses(remote, "Ooty (2)")) == 1
+    assert worker.store.get_trip("Ooty")["participants"] == ["X", "Y"]
+    assert len(worker.store.fetch_expenses("Ooty (2)")) == 1
@@ -0,0 +1,56 @@
+# tests/test_utils.py
+from __future__ import annotations
+
+from trip_splitter.utils import SettlementCache, optimize_settlements, order_settlements
+
+
+def test_settlement_order_is_stable_when_other_balances_change():
+    order = ["A", "B", "C", "D"]
+    before = order_settlements(
+        optimize_settlements({"A": 100, "B": 50, "C": -75, "D": -75}), order
+    )
+    after = order_settlements(
+        optimize_settlements({"A": 100, "B": 150, "C": -75, "D": -175}), order
+    )
+
+    assert before == [("C", "A", 75), ("D", "A", 25), ("D", "B", 50)]
+    assert after == [("C", "A", 75), ("D", "A", 25), ("D", "B", 150)]
+
+
+def test_settlement_order_follows_participant_rank():
+    txns = [("A", "Z", 5.0), ("B", "Z", 5.0)]
+    assert order_settlements(txns, ["Z", "B", "A"]) == [("B", "Z", 5.0), ("A", "Z", 5.0)]
+    assert order_settlements(txns) == txns
+
+
+def test_cache_counts_hits_and_misses():
+    cache = SettlementCache()
+    balances = {"A": 10.0, "B": -10.0}
+
+    assert cache.get(balances) == [("B", "A", 10.0)]
+    # Same vector up to rounding and settled participants: a hit
+    assert cache.get({"A": 10.001, "B": -10.0, "C": 0.0}) == [("B", "A", 10.0)]
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["persistent_hits"]) == (1, 1, 0)
+    assert stats["size"] == 1
+    assert stats["hit_rate"] == 0.5
+
+    cache.clear()
+    assert cache.stats()["size"] == 0 and cache.stats()["hits"] == 0
+
+
+def test_cache_evicts_least_recently_used():
+    cache = SettlementCache(maxsize=2)
+    first, second, third = ({"A": n, "B": -n} for n in (1.0, 2.0, 3.0))
+
+    cache.get(first)
+    cache.get(second)
+    cache.get(first)  # `second` is now the least recently used
+    cache.get(third)
+    assert cache.stats()["size"] == 2
+
+    cache.get(first)
+    assert cache.stats()["hits"] == 2
+    cache.get(second)
+    assert cache.stats()["misses"] == 4